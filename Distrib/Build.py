@@ -550,7 +550,14 @@ class BuildConfig:
                 # Основные модули приложения
                 params.extend(['--hidden-import', 'DateStampGUI'])
                 params.extend(['--hidden-import', 'DateStamp'])
+                params.extend(['--hidden-import', 'DateStampAsync'])
                 params.extend(['--hidden-import', 'PacketFolder'])
+                params.extend(['--hidden-import', 'ImageScanner'])
+                params.extend(['--hidden-import', 'StampDedup'])
+                params.extend(['--hidden-import', 'StampManifest'])
+                params.extend(['--hidden-import', 'StampLog'])
+                params.extend(['--hidden-import', 'StampPipeline'])
+                params.extend(['--hidden-import', 'StampMetrics'])
                 
                 # PIL и его модули
                 params.extend(['--hidden-import', 'PIL'])
@@ -624,7 +631,14 @@ class BuildConfig:
             if not self.is_windows:
                 params.extend(['--hidden-import', 'DateStampGUI'])
                 params.extend(['--hidden-import', 'DateStamp'])
+                params.extend(['--hidden-import', 'DateStampAsync'])
                 params.extend(['--hidden-import', 'PacketFolder'])
+                params.extend(['--hidden-import', 'ImageScanner'])
+                params.extend(['--hidden-import', 'StampDedup'])
+                params.extend(['--hidden-import', 'StampManifest'])
+                params.extend(['--hidden-import', 'StampLog'])
+                params.extend(['--hidden-import', 'StampPipeline'])
+                params.extend(['--hidden-import', 'StampMetrics'])
                 
                 # tkinter и его модули
                 params.extend(['--hidden-import', 'tkinter'])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк чтения даты EXIF: полный разбор exifread против чтения заголовка
+
+Генерирует корпус JPEG/TIFF с EXIF (с миниатюрой и MakerNote) и без него,
+проверяет совпадение результатов и выводит среднее время на файл.
+
+Запуск: python3 benchmarks/bench_exif.py [--count N] [--keep DIR]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import exifread
+import piexif
+from PIL import Image
+from DateStamp import get_datetime_from_exif, read_exif_dates
+
+def exifread_datetime(path):
+    """Исходный способ: полный разбор exifread с настройками по умолчанию"""
+    with open(path, 'rb') as f:
+        tags = exifread.process_file(f)
+    if 'EXIF DateTimeOriginal' in tags:
+        return datetime.strptime(str(tags['EXIF DateTimeOriginal']), '%Y:%m:%d %H:%M:%S')
+    return None
+
+def make_corpus(folder, count):
+    """Создание корпуса файлов: JPEG (big/little-endian EXIF), TIFF, без EXIF"""
+    thumbnail = Image.new('RGB', (160, 120), (90, 90, 90))
+    thumb_path = os.path.join(folder, 'thumb.jpg')
+    thumbnail.save(thumb_path, quality=80)
+    with open(thumb_path, 'rb') as f:
+        thumb_bytes = f.read()
+    os.remove(thumb_path)
+    
+    start = datetime(2024, 1, 1)
+    paths = []
+    for i in range(count):
+        moment = (start + timedelta(minutes=i * 7)).strftime('%Y:%m:%d %H:%M:%S').encode()
+        image = Image.new('RGB', (1920, 1080), (i % 256, 64, 128))
+        kind = i % 4
+        if kind == 0:
+            # piexif: big-endian EXIF с миниатюрой и MakerNote
+            exif = piexif.dump({
+                '0th': {piexif.ImageIFD.Make: b'Bench', piexif.ImageIFD.DateTime: moment},
+                'Exif': {piexif.ExifIFD.DateTimeOriginal: moment,
+                         piexif.ExifIFD.OffsetTimeOriginal: b'+03:00',
+                         piexif.ExifIFD.MakerNote: bytes(range(256)) * 64},
+                '1st': {piexif.ImageIFD.Compression: 6},
+                'thumbnail': thumb_bytes,
+            })
+            path = os.path.join(folder, f'big_endian_{i:05d}.jpg')
+            image.save(path, quality=85, exif=exif)
+        elif kind == 1:
+            # Pillow: little-endian EXIF
+            exif = Image.Exif()
+            exif[0x0132] = moment.decode()
+            exif.get_ifd(0x8769)[0x9003] = moment.decode()
+            path = os.path.join(folder, f'little_endian_{i:05d}.jpg')
+            image.save(path, quality=85, exif=exif)
+        elif kind == 2:
+            exif = Image.Exif()
+            exif.get_ifd(0x8769)[0x9003] = moment.decode()
+            path = os.path.join(folder, f'tiff_{i:05d}.tif')
+            image.save(path, exif=exif)
+        else:
+            path = os.path.join(folder, f'no_exif_{i:05d}.jpg')
+            image.save(path, quality=85)
+        paths.append(path)
+    return paths
+
+def bench(func, paths, repeat):
+    """Среднее время на файл в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            func(path)
+    return (time.perf_counter() - started) / (len(paths) * repeat) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк чтения даты EXIF')
+    parser.add_argument('--count', type=int, default=200, help='Число файлов в корпусе')
+    parser.add_argument('--repeat', type=int, default=3, help='Число проходов по корпусу')
+    parser.add_argument('--keep', help='Папка для корпуса (по умолчанию временная, удаляется)')
+    args = parser.parse_args()
+    
+    folder = args.keep or tempfile.mkdtemp(prefix='datestamp_exif_')
+    os.makedirs(folder, exist_ok=True)
+    try:
+        paths = make_corpus(folder, args.count)
+        mismatches = [path for path in paths if exifread_datetime(path) != get_datetime_from_exif(path)]
+        with open(paths[0], 'rb') as f:
+            print(f"Пример быстрого чтения: {read_exif_dates(f)}")
+        
+        groups = {}
+        for path in paths:
+            groups.setdefault(os.path.basename(path).rsplit('_', 1)[0], []).append(path)
+        print(f"{'корпус':>14} {'exifread, мкс':>14} {'заголовок, мкс':>15} {'ускорение':>10}")
+        for name, group in sorted(groups.items()):
+            full_us = bench(exifread_datetime, group, args.repeat)
+            fast_us = bench(get_datetime_from_exif, group, args.repeat)
+            print(f"{name:>14} {full_us:>14.1f} {fast_us:>15.1f} {full_us / fast_us:>9.1f}x")
+        print(f"Расхождений с exifread: {len(mismatches)}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(folder, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк извлечения даты из имени файла
+
+Сравнивает реестр скомпилированных шаблонов get_datetime_from_filename с
+прежней реализацией (регулярные выражения и словари месяцев создавались
+при каждом вызове, дата собиралась через strptime) на синтетических именах.
+
+Запуск: python3 benchmarks/bench_filename_dates.py [--count 1000000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from DateStamp import get_datetime_from_filename, get_filename_pattern_stats, reset_filename_pattern_memo
+
+def legacy_datetime_from_filename(filename):
+    """Прежняя реализация get_datetime_from_filename (для сравнения)"""
+    try:
+        base_name = os.path.splitext(filename)[0]
+        if base_name.startswith('IMG_') and len(base_name) >= 15:
+            date_part = base_name[4:12]
+            time_part = base_name[13:19]
+            dt_str = f"{date_part[:4]}:{date_part[4:6]}:{date_part[6:8]} {time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}"
+            return datetime.strptime(dt_str, '%Y:%m:%d %H:%M:%S')
+        if len(base_name) >= 15 and base_name[8] == '_' and base_name[:8].isdigit():
+            date_part = base_name[:8]
+            time_part = base_name[9:15]
+            dt_str = f"{date_part[:4]}:{date_part[4:6]}:{date_part[6:8]} {time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}"
+            return datetime.strptime(dt_str, '%Y:%m:%d %H:%M:%S')
+        import re
+        for pattern in (r'camera\d+_(\d{1,2})-(\d{1,2})-(\d{4})_(\d{1,2})h(\d{1,2})m(\d{1,2})s',
+                        r'(\d{1,2})-(\d{1,2})-(\d{4})_(\d{1,2})h(\d{1,2})m(\d{1,2})s'):
+            match = re.search(pattern, base_name)
+            if match:
+                day, month, year, hour, minute, second = match.groups()
+                dt_str = f"{year}-{month.zfill(2)}-{day.zfill(2)} {hour.zfill(2)}:{minute.zfill(2)}:{second.zfill(2)}"
+                return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
+        month_tables = [
+            (r'camera\d+_(\d{4})-([A-Za-z]{3})-(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,3})',
+             {'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04', 'May': '05', 'Jun': '06',
+              'Jul': '07', 'Aug': '08', 'Sep': '09', 'Oct': '10', 'Nov': '11', 'Dec': '12'}),
+            (r'camera\d+_(\d{4})-([А-Яа-я]+)-(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,3})',
+             {'Январь': '01', 'Февраль': '02', 'Март': '03', 'Апрель': '04', 'Май': '05', 'Июнь': '06',
+              'Июль': '07', 'Август': '08', 'Сентябрь': '09', 'Октябрь': '10', 'Ноябрь': '11', 'Декабрь': '12'}),
+            (r'camera\d+_(\d{4})-([A-Za-z]+)-(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,3})',
+             {'January': '01', 'February': '02', 'March': '03', 'April': '04', 'May': '05', 'June': '06',
+              'July': '07', 'August': '08', 'September': '09', 'October': '10', 'November': '11', 'December': '12'}),
+        ]
+        for pattern, months in month_tables:
+            match = re.search(pattern, base_name)
+            if match:
+                year, month_name, day, hour, minute, second, millisecond = match.groups()
+                if month_name in months:
+                    dt_str = f"{year}-{months[month_name]}-{day.zfill(2)} {hour.zfill(2)}:{minute.zfill(2)}:{second.zfill(2)}"
+                    return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
+    except Exception:
+        pass
+    return None
+
+def make_filenames(count):
+    """Синтетические имена файлов всех поддерживаемых форматов и без даты"""
+    months_en = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+    months_ru = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+                 'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
+    names = []
+    for i in range(count):
+        y, mo, d = random.randint(2000, 2030), random.randint(1, 12), random.randint(1, 28)
+        h, mi, s = random.randint(0, 23), random.randint(0, 59), random.randint(0, 59)
+        kind = i % 7
+        if kind == 0:
+            names.append(f"IMG_{y}{mo:02d}{d:02d}_{h:02d}{mi:02d}{s:02d}.jpg")
+        elif kind == 1:
+            names.append(f"{y}{mo:02d}{d:02d}_{h:02d}{mi:02d}{s:02d}.jpg")
+        elif kind == 2:
+            names.append(f"camera13_{d:02d}-{mo:02d}-{y}_{h:02d}h{mi:02d}m{s:02d}s163ms.jpg")
+        elif kind == 3:
+            names.append(f"Главная дорога_{d:02d}-{mo:02d}-{y}_{h:02d}h{mi:02d}m{s:02d}s683ms.jpg")
+        elif kind == 4:
+            names.append(f"camera13_{y}-{months_en[mo - 1]}-{d}_{h}_{mi}_{s}_680.jpg")
+        elif kind == 5:
+            names.append(f"camera13_{y}-{months_ru[mo - 1]}-{d}_{h}_{mi}_{s}_680.jpg")
+        else:
+            names.append(f"DSC_{i:05d}.JPG")
+    return names
+
+def bench(func, names):
+    """Время прохода по списку имен в секундах"""
+    started = time.perf_counter()
+    for name in names:
+        func(name)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарк даты из имени файла')
+    parser.add_argument('--count', type=int, default=1000000, help='Число синтетических имен')
+    args = parser.parse_args()
+    
+    random.seed(0)
+    names = make_filenames(args.count)
+    mismatches = sum(1 for name in names[:10000]
+                     if legacy_datetime_from_filename(name) != get_datetime_from_filename(name))
+    
+    legacy_time = bench(legacy_datetime_from_filename, names)
+    registry_time = bench(get_datetime_from_filename, names)
+    print(f"Имен: {len(names)}")
+    print(f"Прежняя реализация: {legacy_time:.2f} с ({legacy_time / len(names) * 1e6:.2f} мкс/имя)")
+    print(f"Реестр шаблонов:    {registry_time:.2f} с ({registry_time / len(names) * 1e6:.2f} мкс/имя)")
+    print(f"Ускорение: {legacy_time / registry_time:.1f}x, расхождений на первых 10000: {mismatches}")
+    
+    # Имена одного формата лежат в одной папке, как в выгрузке с камеры
+    by_folder = sorted(((i % 7, name) for i, name in enumerate(names)), key=lambda item: item[0])
+    reset_filename_pattern_memo()
+    started = time.perf_counter()
+    for folder, name in by_folder:
+        get_datetime_from_filename(name, f"/camera/{folder}")
+    memo_time = time.perf_counter() - started
+    print(f"С памятью по папкам: {memo_time:.2f} с ({memo_time / len(names) * 1e6:.2f} мкс/имя), "
+          f"{get_filename_pattern_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк переноса метаданных файла: запуск touch на каждый файл против
+вызовов в текущем процессе (preserve_file_metadata)
+
+Число системных операций на файл считается через аудит-хуки Python
+(sys.addaudithook): utime, chmod, запуски процессов и т.д. Запуск touch
+дополнительно стоит fork/exec и сотни системных вызовов в дочернем процессе,
+которые хук не видит, - их отражает время на файл.
+
+Запуск: python3 benchmarks/bench_metadata.py [--count N]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from DateStamp import preserve_file_metadata
+
+_events = Counter()
+_counting = False
+
+def _audit(event, args):
+    """Подсчет аудит-событий файловых и процессных операций"""
+    if _counting and event.startswith(('os.', 'subprocess.', 'shutil.', 'open')):
+        _events[event] += 1
+
+def legacy_preserve_file_metadata(source_path, dest_path):
+    """Прежняя схема: utime + touch -t с временем создания + chmod"""
+    stat_info = os.stat(source_path)
+    os.utime(dest_path, (stat_info.st_atime, stat_info.st_mtime))
+    creation_time = getattr(stat_info, 'st_birthtime', stat_info.st_mtime)
+    formatted_time = datetime.fromtimestamp(creation_time).strftime('%Y%m%d%H%M.%S')
+    subprocess.run(['touch', '-t', formatted_time, dest_path], check=True, capture_output=True, text=True)
+    os.chmod(dest_path, stat_info.st_mode)
+
+def bench(func, pairs):
+    """Время на файл (мкс) и аудит-события на файл"""
+    global _counting
+    _events.clear()
+    _counting = True
+    started = time.perf_counter()
+    for source_path, dest_path in pairs:
+        func(source_path, dest_path)
+    elapsed = time.perf_counter() - started
+    _counting = False
+    per_file = {event: count / len(pairs) for event, count in sorted(_events.items())}
+    return elapsed / len(pairs) * 1e6, per_file
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк переноса метаданных')
+    parser.add_argument('--count', type=int, default=300, help='Число файлов')
+    args = parser.parse_args()
+    
+    sys.addaudithook(_audit)
+    folder = tempfile.mkdtemp(prefix='datestamp_meta_')
+    try:
+        pairs = []
+        for i in range(args.count):
+            source_path = os.path.join(folder, f'src_{i}.jpg')
+            dest_path = os.path.join(folder, f'dst_{i}.jpg')
+            for path in (source_path, dest_path):
+                with open(path, 'wb') as f:
+                    f.write(b'\xff\xd8' + bytes(1024))
+            os.utime(source_path, (1500000000 + i, 1600000000 + i))
+            pairs.append((source_path, dest_path))
+        
+        results = []
+        if shutil.which('touch'):
+            results.append(('touch (прежний)', legacy_preserve_file_metadata))
+        results.append(('в процессе', preserve_file_metadata))
+        for name, func in results:
+            per_file_us, events = bench(func, pairs)
+            print(f"{name:>16}: {per_file_us:8.1f} мкс/файл, операций на файл: "
+                  f"{sum(events.values()):.0f} {events}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
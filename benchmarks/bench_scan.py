@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк обхода дерева папок на медленной файловой системе: os.walk,
+последовательный scan_images и параллельный scan_images_parallel
+
+Сетевая папка (SMB/NFS) имитируется оберткой над os.scandir: каждое чтение
+каталога и каждый stat файла стоят заданную задержку, как запрос к серверу.
+Выводится общее время обхода и время до первого найденного файла - с него
+может начинаться обработка.
+
+Запуск: python3 benchmarks/bench_scan.py [--dirs N] [--files N] [--latency МС]
+"""
+
+import os
+import sys
+import math
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import ImageScanner
+
+_real_scandir = os.scandir
+# Задержка одного запроса к "серверу", с
+LATENCY = 0.0
+
+class SlowEntry:
+    """Запись каталога, у которой stat стоит сетевого запроса"""
+
+    def __init__(self, entry, latency):
+        self._entry = entry
+        self._latency = latency
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_dir(self, follow_symlinks=True):
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        return self._entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self):
+        return self._entry.is_symlink()
+
+    def stat(self, follow_symlinks=True):
+        time.sleep(self._latency)
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+class SlowScandir:
+    """Замена os.scandir с задержкой на чтение каталога"""
+
+    def __init__(self, path, latency):
+        time.sleep(latency)
+        self._it = _real_scandir(path)
+        self._latency = latency
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return (SlowEntry(entry, self._latency) for entry in self._it)
+
+    def __next__(self):
+        return SlowEntry(next(self._it), self._latency)
+
+    def close(self):
+        self._it.close()
+
+def make_tree(folder, dirs, files):
+    """Дерево: dirs папок в два уровня, в каждой files пустых .jpg и .txt"""
+    per_level = max(1, math.ceil(dirs ** 0.5))
+    made = 0
+    for i in range(per_level):
+        for j in range(per_level):
+            if made >= dirs:
+                return
+            path = os.path.join(folder, f'cam{i:03d}', f'day{j:03d}')
+            os.makedirs(path, exist_ok=True)
+            for k in range(files):
+                open(os.path.join(path, f'IMG_{k:05d}.jpg'), 'wb').close()
+                open(os.path.join(path, f'IMG_{k:05d}.txt'), 'wb').close()
+            made += 1
+
+def walk_baseline(root, with_stat):
+    """Прежний обход: os.walk + отбор по расширению (+ stat в обработке)"""
+    for base, dirs, names in os.walk(root):
+        for name in names:
+            if name.lower().endswith(ImageScanner.IMAGE_EXTENSIONS):
+                path = os.path.join(base, name)
+                if with_stat:
+                    # os.stat идет мимо обертки - задержку добавляем явно
+                    time.sleep(LATENCY)
+                    os.stat(path)
+                yield path
+
+def bench(iterator):
+    """(общее время, время до первого файла, число файлов)"""
+    started = time.perf_counter()
+    first = None
+    count = 0
+    for _ in iterator:
+        if first is None:
+            first = time.perf_counter() - started
+        count += 1
+    return time.perf_counter() - started, first or 0.0, count
+
+def main():
+    global LATENCY
+    parser = argparse.ArgumentParser(description='Бенчмарк обхода дерева на медленной ФС')
+    parser.add_argument('--dirs', type=int, default=200, help='Число папок')
+    parser.add_argument('--files', type=int, default=20, help='Изображений в папке')
+    parser.add_argument('--latency', type=float, default=2.0, help='Задержка запроса, мс')
+    parser.add_argument('--threads', default='4,8,16', help='Числа потоков через запятую')
+    parser.add_argument('--stat', action='store_true', help='Запрашивать stat каждого файла')
+    args = parser.parse_args()
+
+    LATENCY = args.latency / 1000
+    folder = tempfile.mkdtemp(prefix='datestamp_scan_')
+    try:
+        make_tree(folder, args.dirs, args.files)
+        os.scandir = lambda path='.': SlowScandir(path, LATENCY)
+
+        runs = [('os.walk', lambda: walk_baseline(folder, args.stat)),
+                ('scan_images', lambda: ImageScanner.scan_images(folder, with_stat=args.stat))]
+        for threads in (int(value) for value in args.threads.split(',')):
+            runs.append((f'parallel x{threads}', lambda threads=threads: ImageScanner.scan_images_parallel(
+                folder, with_stat=args.stat, threads=threads)))
+
+        print(f"Папок: {args.dirs}, изображений: {args.dirs * args.files}, "
+              f"задержка: {args.latency} мс, stat: {'да' if args.stat else 'нет'}")
+        print(f"{'способ':>14} {'всего, с':>9} {'первый, мс':>11} {'файлов':>7} {'ускорение':>10}")
+        baseline = None
+        for name, make_iterator in runs:
+            total, first, count = bench(make_iterator())
+            baseline = baseline or total
+            print(f"{name:>14} {total:>9.2f} {first * 1000:>11.1f} {count:>7} {baseline / total:>9.1f}x")
+    finally:
+        os.scandir = _real_scandir
+        shutil.rmtree(folder, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк растеризации текста штампа: FreeType (draw.text) против атласа глифов
+
+Запуск: python3 benchmarks/bench_stamp_text.py [--count N] [--sizes 30,60,100]
+"""
+
+import os
+import sys
+import time
+import argparse
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import ImageChops
+from DateStamp import (STAMP_FORMAT, get_system_font, get_glyph_atlas,
+                       get_stamp_text_layout, _render_text_mask)
+
+def make_stamps(count):
+    """Генерация строк штампов для последовательных снимков"""
+    start = datetime(2024, 1, 1)
+    return [(start + timedelta(seconds=random.randint(0, 10 ** 8))).strftime(STAMP_FORMAT)
+            for _ in range(count)]
+
+def bench(func, stamps):
+    """Среднее время вызова в микросекундах"""
+    started = time.perf_counter()
+    for text in stamps:
+        func(text)
+    return (time.perf_counter() - started) / len(stamps) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк текста штампа')
+    parser.add_argument('--count', type=int, default=2000, help='Число штампов на размер')
+    parser.add_argument('--sizes', default='20,30,60,100', help='Размеры шрифта через запятую')
+    parser.add_argument('--font-name', default=None, help='Имя шрифта (по умолчанию встроенный)')
+    args = parser.parse_args()
+    
+    random.seed(0)
+    stamps = make_stamps(args.count)
+    print(f"{'размер':>7} {'FreeType, мкс':>14} {'атлас, мкс':>11} {'ускорение':>10} {'совпадение':>11}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        font = get_system_font(size, args.font_name)
+        atlas = get_glyph_atlas(size, args.font_name)
+        if atlas is None:
+            print(f"{size:>7} атлас недоступен для шрифта, используется draw.text")
+            continue
+        
+        identical = all(
+            not ImageChops.difference(get_stamp_text_layout(text, font, atlas)[0],
+                                      _render_text_mask(font, text)[0]).getbbox()
+            for text in stamps[:100]
+        )
+        freetype_us = bench(lambda text: _render_text_mask(font, text), stamps)
+        atlas_us = bench(lambda text: get_stamp_text_layout(text, font, atlas), stamps)
+        print(f"{size:>7} {freetype_us:>14.1f} {atlas_us:>11.1f} {freetype_us / atlas_us:>9.1f}x "
+              f"{'да' if identical else 'НЕТ':>11}")
+
+if __name__ == "__main__":
+    main()
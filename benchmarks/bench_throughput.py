@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пропускной способности ядра штампа: add_datetime_watermark,
+process_images и process_images_with_structure на синтетическом наборе
+
+Набор генерируется заново (или берется готовый из --corpus): JPEG, PNG и
+TIFF нескольких разрешений, половина кадров с датой в EXIF, половина - с
+датой в имени файла. Для каждого сценария выводятся изображения/с, МБ/с
+(по объему исходников) и пиковая память (RSS); сценарий stages раскладывает
+время по стадиям: чтение, дата, шрифт, декодирование, штамп, кодирование,
+метаданные.
+
+Каждый сценарий выполняется в отдельном процессе, чтобы пиковая память не
+накапливалась между сценариями. Результат можно сохранить в JSON (--json) и
+сравнить со старым прогоном (--compare): падение изображений/с больше
+порога (--threshold) отмечается как регрессия, код возврата - 1.
+
+Запуск: python3 benchmarks/bench_throughput.py [--sizes 640x480,1920x1080]
+        [--count N] [--scenarios stages,process_images] [--json result.json]
+        [--compare base.json]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import piexif
+import PIL
+from PIL import Image
+
+import DateStamp
+import ImageScanner
+
+SCENARIOS = ('stages', 'add_datetime_watermark', 'process_images', 'structure',
+             'structure_workers', 'structure_pipeline')
+FORMATS = {'jpg': 'JPEG', 'png': 'PNG', 'tif': 'TIFF'}
+STAGES = ('read', 'date', 'font', 'decode', 'draw', 'encode', 'metadata')
+# Параметры штампа во всех сценариях
+FONT_SIZE = 40
+POSITION = 'bottom-right'
+
+def make_frame(size, seed):
+    """Синтетический кадр: градиенты и шум - сжимается как фотография, а не как заливка"""
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 20 + seed % 40)
+    return Image.merge('RGB', (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), noise))
+
+def make_corpus(folder, sizes, formats, count):
+    """Набор: папка на разрешение, в ней count кадров каждого формата.
+    Четные кадры датируются через EXIF (PNG - через имя файла), нечетные - через имя файла."""
+    start = datetime(2024, 5, 6, 7, 8, 9)
+    for width, height in sizes:
+        subfolder = os.path.join(folder, f'{width}x{height}')
+        os.makedirs(subfolder, exist_ok=True)
+        for extension in formats:
+            for index in range(count):
+                stamp = start + timedelta(minutes=index)
+                image = make_frame((width, height), index)
+                options = {}
+                if index % 2 == 0 and extension != 'png':
+                    name = f'photo_{extension}_{index:04d}.{extension}'
+                    exif = {'Exif': {piexif.ExifIFD.DateTimeOriginal: stamp.strftime('%Y:%m:%d %H:%M:%S').encode()}}
+                    options['exif'] = piexif.dump(exif)
+                else:
+                    name = f"IMG_{stamp.strftime('%Y%m%d_%H%M%S')}_{extension}.{extension}"
+                if extension == 'jpg':
+                    options['quality'] = 90
+                image.save(os.path.join(subfolder, name), FORMATS[extension], **options)
+
+def list_corpus(folder):
+    """Файлы набора: [(путь, размер)]"""
+    return [(scanned.path, scanned.stat.st_size)
+            for scanned in ImageScanner.scan_images(folder, with_stat=True)]
+
+def resolve_date(path, data):
+    """Дата кадра как в process_images: EXIF -> имя файла -> время создания"""
+    return (DateStamp.get_datetime_from_exif(path, data)
+            or DateStamp.get_datetime_from_filename(os.path.basename(path), os.path.dirname(path))
+            or DateStamp.get_file_creation_time(path))
+
+def output_path(corpus, output, path):
+    dest = os.path.join(output, os.path.relpath(path, corpus))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    return dest
+
+def run_stages(files, corpus, output):
+    """Поэтапная обработка: те же вызовы, что внутри add_datetime_watermark"""
+    stages = dict.fromkeys(STAGES, 0.0)
+
+    # Холодная загрузка шрифта и атласа глифов - один раз на процесс
+    DateStamp.clear_font_cache()
+    started = time.perf_counter()
+    DateStamp.get_system_font(FONT_SIZE)
+    DateStamp.get_glyph_atlas(FONT_SIZE)
+    stages['font'] += time.perf_counter() - started
+
+    for path, _ in files:
+        dest = output_path(corpus, output, path)
+        marks = [time.perf_counter()]
+        source_stat = os.stat(path)
+        data = DateStamp.read_source_file(path)
+        marks.append(time.perf_counter())
+        datetime_obj = resolve_date(path, data)
+        marks.append(time.perf_counter())
+        # Повторный запрос шрифта - из кэша, как при обработке серии
+        DateStamp.get_system_font(FONT_SIZE)
+        marks.append(time.perf_counter())
+        image = DateStamp.open_source_image(path, data)
+        image.load()
+        marks.append(time.perf_counter())
+        DateStamp.draw_datetime_stamp(image, datetime_obj, FONT_SIZE, POSITION)
+        marks.append(time.perf_counter())
+        DateStamp.save_stamped_image(image, dest, dest)
+        marks.append(time.perf_counter())
+        DateStamp.preserve_file_metadata(path, dest, source_stat)
+        marks.append(time.perf_counter())
+        for stage, begin, end in zip(STAGES, marks, marks[1:]):
+            stages[stage] += end - begin
+    return stages
+
+def run_watermark(files, corpus, output):
+    """Вызов add_datetime_watermark на каждый файл (дата - как в process_images)"""
+    for path, _ in files:
+        data = DateStamp.read_source_file(path)
+        DateStamp.add_datetime_watermark(path, output_path(corpus, output, path), resolve_date(path, data),
+                                         FONT_SIZE, POSITION, source_data=data)
+
+def run_process_images(corpus, output):
+    """process_images по каждой папке набора (обход у него не рекурсивный)"""
+    for name in sorted(os.listdir(corpus)):
+        folder = os.path.join(corpus, name)
+        if os.path.isdir(folder):
+            DateStamp.process_images(folder, os.path.join(output, name), font_size=FONT_SIZE, position=POSITION)
+
+def peak_rss_mb():
+    """Пиковая память: (процесс сценария, самый большой дочерний процесс), МБ"""
+    try:
+        import resource
+    except ImportError:
+        return None, None  # Windows
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(own / 2 ** 20, 1), round(children / 2 ** 20, 1)
+
+def run_scenario(name, corpus, output, workers):
+    """Выполнение одного сценария в текущем процессе; результат - словарь для JSON"""
+    files = list_corpus(corpus)
+    rss_before, _ = peak_rss_mb()
+    stages = None
+    # Вывод модуля о каждом файле не нужен и искажал бы время
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        if name == 'stages':
+            stages = run_stages(files, corpus, output)
+        elif name == 'add_datetime_watermark':
+            run_watermark(files, corpus, output)
+        elif name == 'process_images':
+            run_process_images(corpus, output)
+        elif name == 'structure':
+            DateStamp.process_images_with_structure(corpus, output, FONT_SIZE, POSITION)
+        elif name == 'structure_workers':
+            DateStamp.process_images_with_structure(corpus, output, FONT_SIZE, POSITION, workers=workers)
+        elif name == 'structure_pipeline':
+            DateStamp.process_images_with_structure(corpus, output, FONT_SIZE, POSITION, workers=workers,
+                                                    pipeline=True)
+        else:
+            raise ValueError(f"неизвестный сценарий: {name}")
+        seconds = time.perf_counter() - started
+
+    rss_peak, rss_children = peak_rss_mb()
+    total_bytes = sum(size for _, size in files)
+    result = {
+        'scenario': name,
+        'images': len(files),
+        'input_mb': round(total_bytes / 2 ** 20, 2),
+        'seconds': round(seconds, 4),
+        'images_per_sec': round(len(files) / seconds, 2) if seconds else None,
+        'mb_per_sec': round(total_bytes / 2 ** 20 / seconds, 2) if seconds else None,
+        'rss_start_mb': rss_before,
+        'peak_rss_mb': rss_peak,
+        'peak_rss_children_mb': rss_children,
+    }
+    if stages is not None:
+        result['stages_sec'] = {stage: round(value, 4) for stage, value in stages.items()}
+        result['stages_ms_per_image'] = {stage: round(value / len(files) * 1000, 3)
+                                         for stage, value in stages.items()} if files else {}
+    return result
+
+def run_isolated(name, corpus, output, workers):
+    """Запуск сценария в отдельном процессе (чистая пиковая память)"""
+    command = [sys.executable, os.path.abspath(__file__), '--run', name, '--corpus', corpus,
+               '--output', output, '--workers', str(workers)]
+    completed = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def parse_sizes(value):
+    return [tuple(int(part) for part in size.lower().split('x')) for size in value.split(',')]
+
+def compare(results, baseline_path, threshold):
+    """Сравнение с прошлым прогоном; True - есть регрессии"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {item['scenario']: item for item in json.load(f)['results']}
+    regressed = False
+    print(f"\nСравнение с {baseline_path}:")
+    for result in results:
+        old = baseline.get(result['scenario'])
+        if not old or not old.get('images_per_sec') or not result['images_per_sec']:
+            continue
+        change = result['images_per_sec'] / old['images_per_sec'] - 1
+        mark = ''
+        if change < -threshold:
+            mark = '  РЕГРЕССИЯ'
+            regressed = True
+        print(f"{result['scenario']:>22} {old['images_per_sec']:>9.2f} -> {result['images_per_sec']:>9.2f} "
+              f"изобр./с ({change:+.1%}){mark}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк пропускной способности штампа')
+    parser.add_argument('--sizes', default='640x480,1920x1080,4000x3000', help='Разрешения через запятую')
+    parser.add_argument('--formats', default='jpg,png,tif', help='Форматы через запятую (jpg, png, tif)')
+    parser.add_argument('--count', type=int, default=6, help='Кадров каждого формата на разрешение')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Сценарии через запятую')
+    parser.add_argument('--workers', type=int, default=0, help='Процессы/потоки для structure_workers и '
+                                                               'structure_pipeline (0 - по числу ядер)')
+    parser.add_argument('--corpus', default=None, help='Папка набора (создается, если пуста; не удаляется)')
+    parser.add_argument('--json', default=None, help='Файл для сохранения результатов')
+    parser.add_argument('--compare', default=None, help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Допустимое падение изобр./с (доля)')
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--output', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Дочерний процесс: один сценарий, результат - JSON в последней строке.
+        # exifread сообщает в лог о каждом PNG без EXIF
+        logging.getLogger('exifread').setLevel(logging.ERROR)
+        print(json.dumps(run_scenario(args.run, args.corpus, args.output, args.workers)))
+        return
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"неизвестный сценарий {name}; доступны: {', '.join(SCENARIOS)}")
+    sizes = parse_sizes(args.sizes)
+    formats = [value for value in args.formats.split(',') if value]
+
+    work = tempfile.mkdtemp(prefix='datestamp_bench_')
+    corpus = args.corpus or os.path.join(work, 'corpus')
+    try:
+        if not os.path.isdir(corpus) or not os.listdir(corpus):
+            started = time.perf_counter()
+            make_corpus(corpus, sizes, formats, args.count)
+            print(f"Набор создан за {time.perf_counter() - started:.1f} с: {corpus}")
+        files = list_corpus(corpus)
+        print(f"Изображений: {len(files)}, объем: {sum(size for _, size in files) / 2 ** 20:.1f} МБ")
+
+        results = []
+        print(f"{'сценарий':>22} {'изобр./с':>9} {'МБ/с':>7} {'время, с':>9} {'RSS, МБ':>8} {'дочерн., МБ':>12}")
+        for name in scenarios:
+            output = os.path.join(work, 'out_' + name)
+            result = run_isolated(name, corpus, output, args.workers)
+            shutil.rmtree(output, ignore_errors=True)
+            results.append(result)
+            print(f"{name:>22} {result['images_per_sec']:>9.2f} {result['mb_per_sec']:>7.2f} "
+                  f"{result['seconds']:>9.2f} {result['peak_rss_mb'] or 0:>8.0f} "
+                  f"{result['peak_rss_children_mb'] or 0:>12.0f}")
+            if 'stages_ms_per_image' in result:
+                print(' ' * 23 + ', '.join(f"{stage} {value:.1f}" for stage, value
+                                           in result['stages_ms_per_image'].items()) + ' (мс/изобр.)')
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'pillow': PIL.__version__,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'sizes': args.sizes,
+                'formats': args.formats,
+                'count': args.count,
+                'workers': args.workers,
+            },
+            'results': results,
+        }
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\nРезультаты сохранены: {args.json}")
+        if args.compare and compare(results, args.compare, args.threshold):
+            sys.exit(1)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
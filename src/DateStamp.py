@@ -1,15 +1,51 @@
 import os
+import io
 import argparse
+import configparser
 import shutil
 import stat
+import mmap
 import platform
+import re
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
+from functools import lru_cache
+from PIL import Image, ImageChops, ImageDraw, ImageFont
 import exifread
 import piexif
+import ImageScanner
+import StampDedup
+import StampManifest
+import StampPipeline
+import StampMetrics
 
-def get_available_fonts():
-    """Получение списка доступных шрифтов для текущей платформы"""
+# Кэши шрифтов на процесс: каталог доступных шрифтов и загруженные объекты
+# шрифтов по ключу (имя шрифта, размер). Сбрасываются clear_font_cache().
+_font_catalog = None
+_font_cache = {}
+_glyph_atlases = {}
+
+def clear_font_cache():
+    """Сброс кэша загруженных шрифтов и каталога доступных шрифтов"""
+    global _font_catalog
+    _font_catalog = None
+    _font_cache.clear()
+    _glyph_atlases.clear()
+    get_stamp_tile.cache_clear()
+
+def get_available_fonts(refresh=False):
+    """Получение списка доступных шрифтов для текущей платформы (с кэшированием)"""
+    global _font_catalog
+    if _font_catalog is None or refresh:
+        _font_catalog = _scan_available_fonts()
+    return list(_font_catalog)
+
+def _scan_available_fonts():
+    """Поиск доступных шрифтов на диске"""
     system = platform.system()
     available_fonts = []
     
@@ -65,7 +101,17 @@ def get_available_fonts():
     return available_fonts
 
 def get_system_font(font_size, font_name=None):
-    """Получение системного шрифта для текущей платформы"""
+    """Получение системного шрифта для текущей платформы (с кэшированием)"""
+    key = (font_name, font_size)
+    font = _font_cache.get(key)
+    if font is None:
+        with StampMetrics.stage('font_load'):
+            font = _load_system_font(font_size, font_name)
+        _font_cache[key] = font
+    return font
+
+def _load_system_font(font_size, font_name=None):
+    """Загрузка системного шрифта с диска"""
     if font_name is None or font_name == "Встроенный (по умолчанию)":
         # Используем старую логику для обратной совместимости
         system = platform.system()
@@ -116,6 +162,171 @@ def get_system_font(font_size, font_name=None):
     # Fallback на встроенный шрифт
     return ImageFont.load_default()
 
+# Формат штампа и алфавит символов, из которых он состоит
+STAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+STAMP_ALPHABET = '0123456789-: '
+
+def _render_text_mask(font, text):
+    """Растеризация текста через FreeType в маску 'L' и ее bbox (как draw.text)"""
+    bbox = font.getbbox(text)
+    mask = Image.new('L', (max(1, bbox[2] - bbox[0]), max(1, bbox[3] - bbox[1])), 0)
+    ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), text, font=font, fill=255)
+    return mask, bbox
+
+def _build_glyph_atlas(font):
+    """Построение атласа глифов алфавита штампа для шрифта.
+    
+    Возвращает None, если атлас не может воспроизвести вывод FreeType
+    точно: шрифт не векторный, дробные advance, кернинг между символами
+    алфавита или отличие пробной строки от draw.text хотя бы на 1 пиксель.
+    """
+    if not isinstance(font, ImageFont.FreeTypeFont):
+        return None
+    
+    glyphs = {}
+    for char in STAMP_ALPHABET:
+        advance = font.getlength(char)
+        if advance != int(advance):
+            return None
+        bbox = font.getbbox(char)
+        mask = None
+        if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
+            mask, _ = _render_text_mask(font, char)
+        glyphs[char] = (mask, bbox, int(advance))
+    
+    # Кернинг: ширина пары должна совпадать с суммой advance
+    for first in STAMP_ALPHABET:
+        for second in STAMP_ALPHABET:
+            if font.getlength(first + second) != glyphs[first][2] + glyphs[second][2]:
+                return None
+    
+    # Перекрываются ли bbox соседних глифов (тогда маски объединяются по максимуму)
+    overlap = any(
+        glyphs[first][1][2] > glyphs[first][2] + glyphs[second][1][0]
+        for first in STAMP_ALPHABET for second in STAMP_ALPHABET
+        if glyphs[first][0] is not None and glyphs[second][0] is not None
+    )
+    atlas = {'glyphs': glyphs, 'overlap': overlap}
+    
+    # Проверка: все пары символов алфавита подряд должны совпасть с FreeType
+    probe = ''.join(first + second for first in STAMP_ALPHABET for second in STAMP_ALPHABET)
+    expected, expected_bbox = _render_text_mask(font, probe)
+    composed, composed_bbox = _compose_text_mask(atlas, probe)
+    if composed_bbox != expected_bbox or ImageChops.difference(composed, expected).getbbox():
+        return None
+    return atlas
+
+def _compose_text_mask(atlas, text):
+    """Сборка маски текста из заранее отрисованных глифов атласа"""
+    glyphs = atlas['glyphs']
+    placed = []
+    left = top = right = bottom = None
+    pen = 0
+    for char in text:
+        mask, (gl, gt, gr, gb), advance = glyphs[char]
+        left = pen + gl if left is None else min(left, pen + gl)
+        right = pen + gr if right is None else max(right, pen + gr)
+        top = gt if top is None else min(top, gt)
+        bottom = gb if bottom is None else max(bottom, gb)
+        if mask is not None:
+            placed.append((mask, pen + gl, gt))
+        pen += advance
+    
+    result = Image.new('L', (max(1, right - left), max(1, bottom - top)), 0)
+    for mask, x, y in placed:
+        box = (x - left, y - top)
+        if atlas['overlap']:
+            region = result.crop(box + (box[0] + mask.size[0], box[1] + mask.size[1]))
+            result.paste(ImageChops.lighter(region, mask), box)
+        else:
+            result.paste(mask, box)
+    return result, (left, top, right, bottom)
+
+def get_glyph_atlas(font_size, font_name=None):
+    """Атлас глифов штампа для шрифта (строится один раз на процесс).
+    
+    Маски не зависят от цвета, поэтому один атлас обслуживает любые цвета
+    текста. Возвращает None, если для шрифта используется draw.text.
+    """
+    key = (font_name, font_size)
+    if key not in _glyph_atlases:
+        font = get_system_font(font_size, font_name)
+        with StampMetrics.stage('glyph_atlas'):
+            _glyph_atlases[key] = _build_glyph_atlas(font)
+    return _glyph_atlases[key]
+
+def get_stamp_text_layout(text, font, atlas=None):
+    """Маска и bbox текста штампа: из атласа, если возможно, иначе через FreeType"""
+    if atlas is not None and all(char in atlas['glyphs'] for char in text):
+        return _compose_text_mask(atlas, text)
+    return _render_text_mask(font, text)
+
+# Отступ фона штампа от текста и число готовых тайлов штампа в LRU-кэше
+STAMP_PADDING = 10
+STAMP_TILE_CACHE_SIZE = 256
+
+def get_stamp_position(position, image_size, text_size, margin_x, margin_y):
+    """Координаты текста штампа на изображении для заданной позиции"""
+    img_width, img_height = image_size
+    text_width, text_height = text_size
+    
+    if position == 'top-left':
+        return margin_x, margin_y
+    elif position == 'top-right':
+        return img_width - text_width - margin_x, margin_y
+    elif position == 'bottom-left':
+        return margin_x, img_height - text_height - margin_y
+    elif position == 'center':
+        return (img_width - text_width) // 2, (img_height - text_height) // 2
+    elif position == 'center-top':
+        return (img_width - text_width) // 2, margin_y
+    elif position == 'center-bottom':
+        return (img_width - text_width) // 2, img_height - text_height - margin_y
+    else:  # bottom-right (по умолчанию)
+        return img_width - text_width - margin_x, img_height - text_height - margin_y
+
+def get_stamp_box(text_size, font_size):
+    """Прямоугольник фона штампа относительно позиции текста (включительно)"""
+    text_width, text_height = text_size
+    # Смещаем рамку вниз относительно текста - размер смещения пропорционален размеру шрифта
+    frame_y_offset = font_size // 4  # 1/4 от размера шрифта для оптимального смещения
+    return (-STAMP_PADDING, -STAMP_PADDING + frame_y_offset,
+            text_width + STAMP_PADDING, text_height + STAMP_PADDING + frame_y_offset)
+
+@lru_cache(maxsize=STAMP_TILE_CACHE_SIZE)
+def get_stamp_tile(dt_string, font_size, font_name, text_color, background_color):
+    """Готовый RGBA-тайл штампа (фон + текст) для наложения на изображение.
+    
+    Возвращает (тайл, смещение тайла относительно позиции текста, размер
+    текста). Штамп рисуется на черной и белой подложках: разница между ними
+    дает прозрачность, черная подложка - цвет с предумноженной альфой.
+    Наложение тайла через paste с маской совпадает с рисованием прямо на
+    фото с точностью до ±2 уровней яркости из-за округления альфы.
+    """
+    font = get_system_font(font_size, font_name)
+    text_mask, bbox = get_stamp_text_layout(dt_string, font, get_glyph_atlas(font_size, font_name))
+    text_size = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+    box = get_stamp_box(text_size, font_size)
+    
+    # Границы тайла: объединение фона и маски текста
+    left = min(box[0], bbox[0])
+    top = min(box[1], bbox[1])
+    right = max(box[2] + 1, bbox[0] + text_mask.size[0])
+    bottom = max(box[3] + 1, bbox[1] + text_mask.size[1])
+    
+    layers = []
+    for base in (0, 255):
+        layer = Image.new('RGB', (right - left, bottom - top), (base, base, base))
+        draw = ImageDraw.Draw(layer, 'RGBA')
+        draw.rectangle([box[0] - left, box[1] - top, box[2] - left, box[3] - top], fill=background_color)
+        draw.bitmap((bbox[0] - left, bbox[1] - top), text_mask, fill=text_color)
+        layers.append(layer)
+    on_black, on_white = layers
+    
+    alpha = ImageChops.invert(ImageChops.subtract(on_white, on_black).getchannel(0))
+    tile = Image.merge('RGBa', on_black.split() + (alpha,)).convert('RGBA')
+    return tile, (left, top), text_size
+
 def create_stamp_preview(font_size=60, font_name=None, position='center', margin_x=50, margin_y=30, 
                         text_color=(255, 255, 255), background_color=(0, 0, 0, 150), 
                         preview_width=400, preview_height=200):
@@ -188,11 +399,190 @@ def create_stamp_preview(font_size=60, font_name=None, position='center', margin
     
     return preview_img
 
-def get_datetime_from_exif(image_path):
-    """Получение даты и времени из EXIF данных"""
+# Граница поиска сегмента APP1 с EXIF в начале JPEG (байт)
+EXIF_HEADER_LIMIT = 256 * 1024
+
+# Теги EXIF с датой: IFD0 DateTime, указатель на EXIF IFD и теги внутри него
+_EXIF_TAG_DATETIME = 0x0132
+_EXIF_TAG_EXIF_IFD = 0x8769
+_EXIF_TAG_DATETIME_ORIGINAL = 0x9003
+_EXIF_TAG_OFFSET_TIME_ORIGINAL = 0x9011
+
+def _parse_exif_datetime(value):
+    """Разбор строки даты EXIF 'YYYY:MM:DD HH:MM:SS' без strptime"""
+    value = value.rstrip(b'\x00 ')
+    if len(value) != 19 or value[4:5] != b':' or value[7:8] != b':' or value[13:14] != b':' or value[16:17] != b':':
+        return None
+    try:
+        return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                        int(value[11:13]), int(value[14:16]), int(value[17:19]))
+    except ValueError:
+        return None
+
+def _find_jpeg_exif(f):
+    """Смещение TIFF-заголовка EXIF в JPEG или None, если сегмента APP1 нет"""
+    f.seek(0)
+    if f.read(2) != b'\xff\xd8':
+        raise ValueError("не JPEG")
+    pos = 2
+    while pos < EXIF_HEADER_LIMIT:
+        f.seek(pos)
+        marker = f.read(4)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError("повреждена структура маркеров JPEG")
+        code = marker[1]
+        if code == 0xFF:  # байт-заполнитель
+            pos += 1
+            continue
+        if code in (0xD9, 0xDA):  # конец заголовков - EXIF нет
+            return None
+        if code == 0x01 or 0xD0 <= code <= 0xD7:  # маркеры без длины
+            pos += 2
+            continue
+        if len(marker) < 4:
+            raise ValueError("обрезанный сегмент JPEG")
+        length = int.from_bytes(marker[2:4], 'big')
+        if code == 0xE1 and f.read(6) == b'Exif\x00\x00':
+            return pos + 10
+        pos += 2 + length
+    raise ValueError("EXIF не найден в пределах EXIF_HEADER_LIMIT")
+
+def _read_ifd(f, base, offset, order):
+    """Чтение записей IFD: {тег: (тип, количество, 4 байта значения/смещения)}"""
+    f.seek(base + offset)
+    raw = f.read(2)
+    if len(raw) < 2:
+        raise ValueError("IFD за пределами файла")
+    count = struct.unpack(order + 'H', raw)[0]
+    if count > 1000:
+        raise ValueError("подозрительное число записей IFD")
+    data = f.read(count * 12)
+    if len(data) < count * 12:
+        raise ValueError("обрезанный IFD")
+    entries = {}
+    for i in range(count):
+        tag, kind, number = struct.unpack(order + 'HHI', data[i * 12:i * 12 + 8])
+        entries[tag] = (kind, number, data[i * 12 + 8:i * 12 + 12])
+    return entries
+
+def _read_ifd_ascii(f, base, entry, order):
+    """Значение ASCII-тега IFD (тип 2) в байтах"""
+    kind, number, value = entry
+    if kind != 2 or number > 256:
+        return None
+    if number <= 4:
+        return value[:number]
+    f.seek(base + struct.unpack(order + 'I', value)[0])
+    return f.read(number)
+
+def _read_tiff_dates(f, base):
+    """Обход IFD0 и EXIF IFD от TIFF-заголовка по смещению base"""
+    f.seek(base)
+    header = f.read(8)
+    if header[:2] == b'II':
+        order = '<'
+    elif header[:2] == b'MM':
+        order = '>'
+    else:
+        raise ValueError("неизвестный порядок байт TIFF")
+    magic, ifd0_offset = struct.unpack(order + 'HI', header[2:8])
+    if magic != 42:
+        raise ValueError("неверная сигнатура TIFF")
+    
+    dates = {}
+    ifd0 = _read_ifd(f, base, ifd0_offset, order)
+    if _EXIF_TAG_DATETIME in ifd0:
+        value = _read_ifd_ascii(f, base, ifd0[_EXIF_TAG_DATETIME], order)
+        dates['DateTime'] = _parse_exif_datetime(value) if value else None
+    if _EXIF_TAG_EXIF_IFD in ifd0:
+        exif_offset = struct.unpack(order + 'I', ifd0[_EXIF_TAG_EXIF_IFD][2])[0]
+        exif_ifd = _read_ifd(f, base, exif_offset, order)
+        if _EXIF_TAG_DATETIME_ORIGINAL in exif_ifd:
+            value = _read_ifd_ascii(f, base, exif_ifd[_EXIF_TAG_DATETIME_ORIGINAL], order)
+            dates['DateTimeOriginal'] = _parse_exif_datetime(value) if value else None
+        if _EXIF_TAG_OFFSET_TIME_ORIGINAL in exif_ifd:
+            value = _read_ifd_ascii(f, base, exif_ifd[_EXIF_TAG_OFFSET_TIME_ORIGINAL], order)
+            dates['OffsetTimeOriginal'] = value.rstrip(b'\x00 ').decode('ascii', 'replace') if value else None
+    return dates
+
+def read_exif_dates(f):
+    """Быстрое чтение дат EXIF из заголовка JPEG/TIFF без полного разбора файла.
+    
+    Читает только первый сегмент APP1 (JPEG) или IFD0 и EXIF IFD (TIFF) и
+    возвращает словарь с ключами DateTimeOriginal, DateTime (datetime) и
+    OffsetTimeOriginal (строка) для найденных тегов. Для других форматов и
+    поврежденных заголовков выбрасывает ValueError.
+    """
+    f.seek(0)
+    signature = f.read(4)
+    if signature[:2] == b'\xff\xd8':
+        base = _find_jpeg_exif(f)
+        if base is None:
+            return {}
+        return _read_tiff_dates(f, base)
+    if signature in (b'II*\x00', b'MM\x00*'):
+        return _read_tiff_dates(f, 0)
+    raise ValueError("формат не поддерживается быстрым чтением EXIF")
+
+def read_source_file(image_path):
+    """Однократное чтение исходного файла в память.
+    
+    Байты передаются и в get_datetime_from_exif, и в add_datetime_watermark
+    (параметры data/source_data), чтобы файл не читался дважды.
+    """
+    with StampMetrics.stage('read'), open(image_path, 'rb') as f:
+        data = f.read()
+    StampMetrics.count('bytes_read', len(data))
+    return data
+
+# Байт на пиксель во внутреннем представлении Pillow (RGB и большинство
+# многоканальных режимов хранятся по 4 байта на пиксель)
+_MODE_PIXEL_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2, 'I;16N': 2}
+# В режиме с бюджетом памяти изображения, которые после декодирования займут
+# больше этого объема, обрабатываются без копий файла в памяти
+LARGE_IMAGE_BYTES = 64 * 1024 * 1024
+
+def estimate_decoded_size(image_path):
+    """Объем декодированного изображения по заголовку файла (без декодирования)"""
     try:
-        with open(image_path, 'rb') as f:
-            tags = exifread.process_file(f)
+        with Image.open(image_path) as image:
+            width, height = image.size
+            return width * height * _MODE_PIXEL_BYTES.get(image.mode, 4)
+    except Exception:
+        # Формат не распознан по заголовку - оцениваем по размеру файла
+        return os.path.getsize(image_path)
+
+def estimate_stamp_memory(image_path, file_size=None):
+    """Оценка пиковой памяти обработки файла: (байт, обрабатывать через файлы).
+    
+    Обычный путь держит в памяти байты исходника, декодированное изображение
+    и закодированный результат. Для больших изображений (LARGE_IMAGE_BYTES)
+    копии файла не хранятся: декодирование идет из файла, кодирование - сразу
+    в файл результата, и в памяти остается только само изображение.
+    """
+    decoded = estimate_decoded_size(image_path)
+    if decoded > LARGE_IMAGE_BYTES:
+        return decoded, True
+    if file_size is None:
+        file_size = os.path.getsize(image_path)
+    return decoded + 2 * file_size, False
+
+def get_datetime_from_exif(image_path, data=None):
+    """Получение даты и времени из EXIF данных (data - уже прочитанные байты файла)"""
+    with StampMetrics.stage('exif'):
+        return _read_exif_datetime(image_path, data)
+
+def _read_exif_datetime(image_path, data=None):
+    try:
+        with (io.BytesIO(data) if data is not None else open(image_path, 'rb')) as f:
+            try:
+                return read_exif_dates(f).get('DateTimeOriginal')
+            except (ValueError, struct.error):
+                pass
+            
+            # Резервный путь для остальных форматов и нестандартных заголовков
+            f.seek(0)
+            tags = exifread.process_file(f, details=False, stop_tag='DateTimeOriginal')
             if 'EXIF DateTimeOriginal' in tags:
                 dt_str = str(tags['EXIF DateTimeOriginal'])
                 return datetime.strptime(dt_str, '%Y:%m:%d %H:%M:%S')
@@ -200,101 +590,197 @@ def get_datetime_from_exif(image_path):
         pass
     return None
 
-def get_datetime_from_filename(filename):
-    """Извлечение даты и времени из имени файла"""
+# Названия месяцев в именах файлов: сокращения, полные английские и русские
+MONTH_NAMES = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+    'January': 1, 'February': 2, 'March': 3, 'April': 4, 'June': 6,
+    'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12,
+    'Январь': 1, 'Февраль': 2, 'Март': 3, 'Апрель': 4, 'Май': 5, 'Июнь': 6,
+    'Июль': 7, 'Август': 8, 'Сентябрь': 9, 'Октябрь': 10, 'Ноябрь': 11, 'Декабрь': 12
+}
+
+# Встроенные шаблоны дат в именах файлов (в порядке приоритета). Именованные
+# группы: year, month (число или название из MONTH_NAMES), day, hour, minute, second
+BUILTIN_FILENAME_PATTERNS = [
+    # IMG_20230101_123456.jpg
+    ('img', r'^IMG_(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2}).(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})'),
+    # 20230101_123456.jpg
+    ('digits', r'^(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})_(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})'),
+    # camera13_01-01-2024_22h16m08s163ms.jpg, Главная дорога_01-12-2024_08h36m46s683ms.jpg
+    ('dmy_hms', r'(?P<day>\d{1,2})-(?P<month>\d{1,2})-(?P<year>\d{4})_(?P<hour>\d{1,2})h(?P<minute>\d{1,2})m(?P<second>\d{1,2})s'),
+    # camera13_2023-Nov-21_13_36_19_680.jpg, camera13_2023-Ноябрь-21_..., camera13_2023-November-21_...
+    ('camera_month_name', r'camera\d+_(?P<year>\d{4})-(?P<month>[^\W\d_]+)-(?P<day>\d{1,2})_(?P<hour>\d{1,2})_(?P<minute>\d{1,2})_(?P<second>\d{1,2})_\d{1,3}'),
+]
+
+_DATE_FIELDS = ('year', 'month', 'day', 'hour', 'minute', 'second')
+
+# Пользовательские шаблоны (проверяются раньше встроенных) и скомпилированный реестр
+_custom_filename_patterns = []
+_filename_pattern_registry = None
+
+# Память по папкам: последний сработавший шаблон и позиция совпадения,
+# счетчики попаданий/промахов этой памяти. Дату из имени определяют
+# одновременно потоки конвейера, обхода и асинхронного интерфейса, поэтому
+# память и счетчики меняются только под блокировкой
+FILENAME_PATTERN_MEMO_SIZE = 10000
+_directory_pattern_memo = {}
+_filename_pattern_stats = {'hits': 0, 'misses': 0}
+_filename_pattern_lock = threading.Lock()
+
+def register_filename_pattern(name, pattern):
+    """Добавление пользовательского шаблона даты в имени файла.
+    
+    Шаблон - регулярное выражение с именованными группами year, month, day,
+    hour, minute, second (month - число или название из MONTH_NAMES).
+    Пользовательские шаблоны проверяются раньше встроенных.
+    """
+    global _filename_pattern_registry
+    compiled = re.compile(pattern)
+    missing = [field for field in _DATE_FIELDS if field not in compiled.groupindex]
+    if missing:
+        raise ValueError(f"В шаблоне '{name}' нет групп: {', '.join(missing)}")
+    _custom_filename_patterns.append((name, pattern))
+    _filename_pattern_registry = None
+    reset_filename_pattern_memo()
+
+def reset_filename_pattern_memo():
+    """Сброс памяти шаблонов по папкам и счетчиков попаданий"""
+    with _filename_pattern_lock:
+        _directory_pattern_memo.clear()
+        _filename_pattern_stats['hits'] = 0
+        _filename_pattern_stats['misses'] = 0
+
+def get_filename_pattern_stats():
+    """Счетчики памяти шаблонов: hits - дата найдена запомненным для папки
+    шаблоном, misses - понадобился полный поиск по всем шаблонам"""
+    with _filename_pattern_lock:
+        return dict(_filename_pattern_stats)
+
+def _init_worker_process(custom_patterns, metrics=False):
+    """Инициализация процесса пула: перенос пользовательских шаблонов имен
+    файлов; metrics - передавать замеры стадий основному процессу"""
+    for name, pattern in custom_patterns:
+        if (name, pattern) not in _custom_filename_patterns:
+            register_filename_pattern(name, pattern)
+    if metrics:
+        StampMetrics.enable_metrics(forward=True)
+
+def get_custom_filename_patterns():
+    """Список зарегистрированных пользовательских шаблонов (имя, выражение)"""
+    return list(_custom_filename_patterns)
+
+def load_filename_patterns(config_path):
+    """Загрузка пользовательских шаблонов из секции [FilenamePatterns] ini-файла
+    (символ % в выражении записывается как %%, как при сохранении из GUI)"""
+    config = configparser.ConfigParser()
+    config.read(config_path, encoding='utf-8')
+    if 'FilenamePatterns' in config:
+        for name, pattern in config['FilenamePatterns'].items():
+            register_filename_pattern(name, pattern)
+
+def _get_filename_pattern_registry():
+    """Скомпилированный реестр: общее выражение и описание каждого шаблона.
+    
+    Все шаблоны объединяются в одно выражение - имя без даты отсеивается за
+    один проход. Само совпадение ищется отдельными выражениями шаблонов в
+    порядке приоритета: общее выражение вернуло бы самое левое совпадение, а
+    не шаблон с наибольшим приоритетом. Для каждого шаблона хранятся номера
+    групп полей даты, по которым datetime собирается сразу из чисел.
+    """
+    global _filename_pattern_registry
+    if _filename_pattern_registry is None:
+        entries = _custom_filename_patterns + BUILTIN_FILENAME_PATTERNS
+        alternatives = []
+        for index, (name, pattern) in enumerate(entries):
+            # Переименовываем группы, чтобы имена не повторялись между альтернативами
+            renamed = re.sub(r'\(\?P<(\w+)>', lambda m: f'(?P<p{index}_{m.group(1)}>', pattern)
+            alternatives.append(f'(?:{renamed})')
+        combined = re.compile('|'.join(alternatives))
+        specs = []
+        for name, pattern in entries:
+            single = re.compile(pattern)
+            groups = tuple(single.groupindex[field] for field in _DATE_FIELDS)
+            specs.append((name, single, groups))
+        _filename_pattern_registry = (combined, specs)
+    return _filename_pattern_registry
+
+def _datetime_from_match(match, groups):
+    """Сборка datetime из групп совпадения; None, если название месяца
+    неизвестно или такой даты нет в календаре (например, 31-02)"""
+    year, month, day, hour, minute, second = match.group(*groups)
+    if month.isdigit():
+        month = int(month)
+    else:
+        month = MONTH_NAMES.get(month)
+        if month is None:
+            return None
+    try:
+        return datetime(int(year), month, int(day), int(hour), int(minute), int(second))
+    except ValueError:
+        return None
+
+def get_datetime_from_filename(filename, directory=None):
+    """Извлечение даты и времени из имени файла
+    
+    directory - папка файла. Для папки запоминается сработавший шаблон и
+    позиция совпадения: этот шаблон сначала проверяется одним выражением,
+    привязанным к этой позиции, и только при неудаче - поиском по всему
+    имени. Шаблоны с большим приоритетом и совпадения левее запомненной
+    позиции проверяются всегда, поэтому результат совпадает с полным поиском.
+    """
+    with StampMetrics.stage('filename_date'):
+        return _parse_filename_datetime(filename, directory)
+
+def _search_datetime(single, groups, base_name):
+    """Первая допустимая дата одного шаблона: (дата, позиция) или (None, None)"""
+    for match in single.finditer(base_name):
+        datetime_obj = _datetime_from_match(match, groups)
+        if datetime_obj is not None:
+            return datetime_obj, match.start()
+        # Неизвестный месяц или невозможная дата - продолжаем поиск дальше по имени
+    return None, None
+
+def _parse_filename_datetime(filename, directory=None):
     try:
-        # Попробуем разные форматы имен файлoв
         base_name = os.path.splitext(filename)[0]
+        combined, specs = _get_filename_pattern_registry()
+        if combined.search(base_name) is None:
+            if directory is not None:
+                with _filename_pattern_lock:
+                    _filename_pattern_stats['misses'] += 1
+            return None
         
-        # Формат: IMG_20230101_123456.jpg
-        if base_name.startswith('IMG_') and len(base_name) >= 15:
-            date_part = base_name[4:12]  # 20230101
-            time_part = base_name[13:19]  # 123456
-            dt_str = f"{date_part[:4]}:{date_part[4:6]}:{date_part[6:8]} {time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}"
-            return datetime.strptime(dt_str, '%Y:%m:%d %H:%M:%S')
-        
-        # Формат: 20230101_123456.jpg (только если начинается с цифр)
-        if len(base_name) >= 15 and base_name[8] == '_' and base_name[:8].isdigit():
-            date_part = base_name[:8]  # 20230101
-            time_part = base_name[9:15]  # 123456
-            dt_str = f"{date_part[:4]}:{date_part[4:6]}:{date_part[6:8]} {time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}"
-            return datetime.strptime(dt_str, '%Y:%m:%d %H:%M:%S')
-        
-        # Универсальный поиск паттерна даты в любом имени файла
-        import re
+        memo = None
+        if directory is not None:
+            with _filename_pattern_lock:
+                memo = _directory_pattern_memo.get(directory)
         
-        # Паттерн 1: camera13_DD-MM-YYYY_HHhMMmSSs (например: camera13_01-01-2024_22h16m08s163ms.jpg)
-        pattern1 = r'camera\d+_(\d{1,2})-(\d{1,2})-(\d{4})_(\d{1,2})h(\d{1,2})m(\d{1,2})s'
-        match1 = re.search(pattern1, base_name)
-        if match1:
-            day, month, year, hour, minute, second = match1.groups()
-            date_str = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            time_str = f"{hour.zfill(2)}:{minute.zfill(2)}:{second.zfill(2)}"
-            dt_str = f"{date_str} {time_str}"
-            return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
-        
-        
-        # Паттерн 2: DD-MM-YYYY_HHhMMmSSs (например: Главная дорога_01-12-2024_08h36m46s683ms.jpg)
-        pattern2 = r'(\d{1,2})-(\d{1,2})-(\d{4})_(\d{1,2})h(\d{1,2})m(\d{1,2})s'
-        match2 = re.search(pattern2, base_name)
-        if match2:
-            day, month, year, hour, minute, second = match2.groups()
-            date_str = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            time_str = f"{hour.zfill(2)}:{minute.zfill(2)}:{second.zfill(2)}"
-            dt_str = f"{date_str} {time_str}"
-            return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
-        
-        # Паттерн 3: camera13_YYYY-Mon-DD_HH_MM_SS_ms (например: camera13_2023-Nov-21_13_36_19_680.jpg)
-        pattern3 = r'camera\d+_(\d{4})-([A-Za-z]{3})-(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,3})'
-        match3 = re.search(pattern3, base_name)
-        if match3:
-            year, month_abbr, day, hour, minute, second, millisecond = match3.groups()
-            # Словарь сокращений месяцев
-            month_abbr_to_num = {
-                'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04', 'May': '05', 'Jun': '06',
-                'Jul': '07', 'Aug': '08', 'Sep': '09', 'Oct': '10', 'Nov': '11', 'Dec': '12'
-            }
-            if month_abbr in month_abbr_to_num:
-                date_str = f"{year}-{month_abbr_to_num[month_abbr]}-{day.zfill(2)}"
-                time_str = f"{hour.zfill(2)}:{minute.zfill(2)}:{second.zfill(2)}"
-                dt_str = f"{date_str} {time_str}"
-                return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
-        
-        # Паттерн 4: camera13_YYYY-ПолноеМесяц-DD_HH_MM_SS_ms (например: camera13_2023-Ноябрь-21_13_36_19_680.jpg)
-        pattern4 = r'camera\d+_(\d{4})-([А-Яа-я]+)-(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,3})'
-        match4 = re.search(pattern4, base_name)
-        if match4:
-            year, month_ru, day, hour, minute, second, millisecond = match4.groups()
-            # Словарь русских названий месяцев
-            month_ru_to_num = {
-                'Январь': '01', 'Февраль': '02', 'Март': '03', 'Апрель': '04', 'Май': '05', 'Июнь': '06',
-                'Июль': '07', 'Август': '08', 'Сентябрь': '09', 'Октябрь': '10', 'Ноябрь': '11', 'Декабрь': '12'
-            }
-            if month_ru in month_ru_to_num:
-                date_str = f"{year}-{month_ru_to_num[month_ru]}-{day.zfill(2)}"
-                time_str = f"{hour.zfill(2)}:{minute.zfill(2)}:{second.zfill(2)}"
-                dt_str = f"{date_str} {time_str}"
-                return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
-        
-        # Паттерн 5: camera13_YYYY-ПолноеМесяцEn-DD_HH_MM_SS_ms (например: camera13_2023-November-21_13_36_19_680.jpg)
-        pattern5 = r'camera\d+_(\d{4})-([A-Za-z]+)-(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,2})_(\d{1,3})'
-        match5 = re.search(pattern5, base_name)
-        if match5:
-            year, month_en, day, hour, minute, second, millisecond = match5.groups()
-            # Словарь полных английских названий месяцев
-            month_en_to_num = {
-                'January': '01', 'February': '02', 'March': '03', 'April': '04', 'May': '05', 'June': '06',
-                'July': '07', 'August': '08', 'September': '09', 'October': '10', 'November': '11', 'December': '12'
-            }
-            if month_en in month_en_to_num:
-                date_str = f"{year}-{month_en_to_num[month_en]}-{day.zfill(2)}"
-                time_str = f"{hour.zfill(2)}:{minute.zfill(2)}:{second.zfill(2)}"
-                dt_str = f"{date_str} {time_str}"
-                return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
-            
+        # Шаблоны - по приоритету: пользовательские раньше встроенных
+        for key, (name, single, groups) in enumerate(specs):
+            if memo is not None and memo[0] == key:
+                start = memo[1]
+                match = single.match(base_name, start)
+                datetime_obj = _datetime_from_match(match, groups) if match else None
+                # Совпадение левее запомненной позиции нашел бы и полный поиск
+                if datetime_obj is not None and (start == 0 or single.search(base_name).start() == start):
+                    with _filename_pattern_lock:
+                        _filename_pattern_stats['hits'] += 1
+                    return datetime_obj
+            datetime_obj, start = _search_datetime(single, groups, base_name)
+            if datetime_obj is not None:
+                if directory is not None:
+                    with _filename_pattern_lock:
+                        _filename_pattern_stats['misses'] += 1
+                        if len(_directory_pattern_memo) >= FILENAME_PATTERN_MEMO_SIZE:
+                            _directory_pattern_memo.clear()
+                        _directory_pattern_memo[directory] = (key, start)
+                return datetime_obj
+        if directory is not None:
+            with _filename_pattern_lock:
+                _filename_pattern_stats['misses'] += 1
     except Exception as e:
         print(f"Ошибка парсинга даты из имени файла '{filename}': {e}")
-        pass
     return None
 
 def get_file_creation_time(image_path):
@@ -305,47 +791,108 @@ def get_file_creation_time(image_path):
     except:
         return None
 
-def preserve_file_metadata(source_path, dest_path):
-    """Сохранение метаданных файла (дата создания, модификации, права доступа)"""
+def get_birth_time(stat_info):
+    """Время создания файла из результата stat (None, если ОС его не сообщает)"""
+    birth_time = getattr(stat_info, 'st_birthtime', None)
+    if birth_time is None and platform.system() == 'Windows':
+        # До Python 3.12 на Windows время создания возвращается в st_ctime
+        birth_time = stat_info.st_ctime
+    return birth_time
+
+_macos_crtime_api = None
+
+def _set_birth_time_macos(path, birth_time):
+    """Установка времени создания на macOS через setattrlist(ATTR_CMN_CRTIME)"""
+    global _macos_crtime_api
+    import ctypes
+    
+    if _macos_crtime_api is None:
+        import ctypes.util
+        
+        class AttrList(ctypes.Structure):
+            _fields_ = [('bitmapcount', ctypes.c_ushort), ('reserved', ctypes.c_uint16),
+                        ('commonattr', ctypes.c_uint32), ('volattr', ctypes.c_uint32),
+                        ('dirattr', ctypes.c_uint32), ('fileattr', ctypes.c_uint32),
+                        ('forkattr', ctypes.c_uint32)]
+        
+        class Timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+        
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        _macos_crtime_api = (libc, AttrList, Timespec)
+    
+    libc, AttrList, Timespec = _macos_crtime_api
+    seconds = int(birth_time)
+    attrs = AttrList(5, 0, 0x00000200, 0, 0, 0, 0)  # ATTR_BIT_MAP_COUNT, ATTR_CMN_CRTIME
+    value = Timespec(seconds, int(round((birth_time - seconds) * 1e9)))
+    if libc.setattrlist(os.fsencode(path), ctypes.byref(attrs), ctypes.byref(value),
+                        ctypes.sizeof(value), 0) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+def _set_birth_time_windows(path, birth_time):
+    """Установка времени создания на Windows через SetFileTime"""
+    import ctypes
+    from ctypes import wintypes
+    
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.CreateFileW.restype = wintypes.HANDLE
+    handle = kernel32.CreateFileW(path, 0x0100, 0x7, None, 3, 0x02000000, None)  # FILE_WRITE_ATTRIBUTES, OPEN_EXISTING
+    if handle in (None, wintypes.HANDLE(-1).value):
+        raise ctypes.WinError(ctypes.get_last_error())
+    try:
+        # FILETIME - интервалы по 100 нс от 1601-01-01
+        filetime = ctypes.c_ulonglong(int(birth_time * 10000000) + 116444736000000000)
+        if not kernel32.SetFileTime(wintypes.HANDLE(handle), ctypes.byref(filetime), None, None):
+            raise ctypes.WinError(ctypes.get_last_error())
+    finally:
+        kernel32.CloseHandle(wintypes.HANDLE(handle))
+
+def set_birth_time(path, birth_time):
+    """Установка времени создания файла средствами ОС.
+    
+    Возвращает False, если ОС не позволяет его изменить (Linux: время
+    создания в statx не меняется из пользовательского пространства).
+    """
+    system = platform.system()
+    if system == 'Darwin':
+        _set_birth_time_macos(path, birth_time)
+        return True
+    if system == 'Windows':
+        _set_birth_time_windows(path, birth_time)
+        return True
+    return False
+
+def preserve_file_metadata(source_path, dest_path, source_stat=None):
+    """Сохранение метаданных файла (дата создания, модификации, права доступа)
+    
+    Все выполняется в текущем процессе: время доступа и модификации с
+    наносекундной точностью, время создания через API ОС, права доступа.
+    source_stat - уже полученный результат os.stat исходного файла.
+    """
+    with StampMetrics.stage('metadata'):
+        _apply_file_metadata(source_path, dest_path, source_stat)
+
+def _apply_file_metadata(source_path, dest_path, source_stat=None):
     try:
         # Получаем метаданные исходного файла
-        stat_info = os.stat(source_path)
+        stat_info = source_stat if source_stat is not None else os.stat(source_path)
         
         # Устанавливаем время модификации и доступа
-        os.utime(dest_path, (stat_info.st_atime, stat_info.st_mtime))
+        os.utime(dest_path, ns=(stat_info.st_atime_ns, stat_info.st_mtime_ns))
         
-        # Попытка установить время создания через системную команду (только для macOS/Linux)
-        import platform
-        if platform.system() in ['Darwin', 'Linux']:  # macOS или Linux
-            try:
-                import subprocess
-                # Форматируем время создания для команды touch
-                creation_time = stat_info.st_birthtime
-                formatted_time = datetime.fromtimestamp(creation_time).strftime('%Y%m%d%H%M.%S')
-                
-                # Выполняем команду touch для установки времени создания
-                result = subprocess.run(['touch', '-t', formatted_time, dest_path], 
-                                      check=True, capture_output=True, text=True)
-                
-            except (subprocess.CalledProcessError, FileNotFoundError, OSError) as e:
-                print(f"Предупреждение: touch не сработал для {os.path.basename(dest_path)}: {e}")
-                # Альтернативный способ - копируем файл с сохранением метаданных
-                try:
-                    import shutil
-                    shutil.copystat(source_path, dest_path)
-                except Exception as e2:
-                    print(f"Предупреждение: copystat не сработал: {e2}")
-        else:
-            # Для Windows используем только стандартные методы Python
+        # Время создания - после utime: на macOS установка mtime раньше
+        # времени создания сдвигает и его
+        birth_time = get_birth_time(stat_info)
+        if birth_time is not None:
             try:
-                import shutil
-                shutil.copystat(source_path, dest_path)
-            except Exception as e:
-                print(f"Предупреждение: не удалось сохранить метаданные: {e}")
+                set_birth_time(dest_path, birth_time)
+            except (OSError, AttributeError, ValueError) as e:
+                print(f"Предупреждение: не удалось установить время создания для {os.path.basename(dest_path)}: {e}")
         
         # Устанавливаем права доступа (только если возможно)
         try:
-            os.chmod(dest_path, stat_info.st_mode)
+            os.chmod(dest_path, stat.S_IMODE(stat_info.st_mode))
         except (OSError, PermissionError):
             pass  # Игнорируем ошибки прав доступа
             
@@ -353,81 +900,457 @@ def preserve_file_metadata(source_path, dest_path):
         print(f"Предупреждение: не удалось сохранить метаданные для {dest_path}: {e}")
         pass  # Игнорируем ошибки метаданных
 
-def add_datetime_watermark(input_path, output_path, datetime_obj, font_size=30, 
-                          position='bottom-right', opacity=0.7, text_color=(255, 255, 255),
-                          background_color=(0, 0, 0, 150), margin_x=10, margin_y=10, font_name=None):
-    """Добавление водяного знака с датой и временем"""
+def get_jpeg_save_options(image, jpeg_quality=95):
+    """Параметры сохранения JPEG.
+    
+    В режиме 'keep' кодер получает исходные таблицы квантования и схему
+    субдискретизации: повторное сжатие вне штампа теряет меньше, чем при
+    фиксированном качестве, но без потерь не обходится. Ошибка зависит от
+    содержимого: на плавных кадрах - единицы уровней, на мелких деталях -
+    десятки, и с каждым повторным штампом растет. Для источников не в JPEG
+    используется качество 95.
+    """
+    if jpeg_quality == 'keep':
+        if image.format == 'JPEG':
+            return {'quality': 'keep', 'subsampling': 'keep'}
+        jpeg_quality = 95
+    return {'quality': int(jpeg_quality)}
+
+def get_metadata_save_options(image):
+    """EXIF и ICC-профиль исходного изображения для передачи в image.save.
     
+    Блок EXIF переносится без повторного чтения файла. Ориентация
+    сбрасывается в 1: штамп рисуется по пикселям как есть, и поворот
+    в просмотрщике развернул бы его вместе с кадром.
+    """
+    options = {}
+    exif = image.info.get('exif')
+    if exif:
+        exif_data = image.getexif()
+        if exif_data.get(0x0112, 1) != 1:
+            exif_data[0x0112] = 1
+            exif = exif_data.tobytes()
+        options['exif'] = exif
+    if image.info.get('icc_profile'):
+        options['icc_profile'] = image.info['icc_profile']
+    return options
+
+def parse_jpeg_quality(value):
+    """Разбор значения качества JPEG из командной строки: число или 'keep'"""
+    if value == 'keep':
+        return value
+    quality = int(value)
+    if not 1 <= quality <= 100:
+        raise argparse.ArgumentTypeError("качество JPEG должно быть от 1 до 100 или 'keep'")
+    return quality
+
+def open_source_image(input_path, source_data=None):
+    """Открытие исходного изображения (из байтов source_data, если переданы)"""
     # Открываем изображение напрямую
     if input_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-        image = Image.open(input_path)
-    else:
-        # Для других форматов пробуем использовать OpenCV
-        try:
-            import cv2
+        return Image.open(io.BytesIO(source_data) if source_data is not None else input_path)
+    
+    # Для других форматов пробуем использовать OpenCV
+    try:
+        import cv2
+        if source_data is not None:
+            import numpy as np
+            img_cv = cv2.imdecode(np.frombuffer(source_data, np.uint8), cv2.IMREAD_COLOR)
+        else:
             img_cv = cv2.imread(input_path)
-            image = Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
-        except ImportError:
-            # Если OpenCV недоступен, пробуем открыть через PIL
-            try:
-                image = Image.open(input_path)
-            except Exception as e:
-                raise Exception(f"Не удалось открыть изображение {input_path}. OpenCV недоступен, а PIL не поддерживает этот формат: {e}")
+        return Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
+    except ImportError:
+        # Если OpenCV недоступен, пробуем открыть через PIL
+        try:
+            return Image.open(io.BytesIO(source_data) if source_data is not None else input_path)
+        except Exception as e:
+            raise Exception(f"Не удалось открыть изображение {input_path}. OpenCV недоступен, а PIL не поддерживает этот формат: {e}")
+
+def draw_datetime_stamp(image, datetime_obj, font_size=30, position='bottom-right',
+                        text_color=(255, 255, 255), background_color=(0, 0, 0, 150),
+                        margin_x=10, margin_y=10, font_name=None, canvas_size=None, offset=(0, 0)):
+    """Нанесение штампа даты и времени на изображение (на месте)
     
+    canvas_size и offset - если image только фрагмент кадра: размер всего
+    кадра и положение фрагмента в нем (см. stamp_in_place).
+    """
     # Форматируем дату и время
-    dt_string = datetime_obj.strftime('%Y-%m-%d %H:%M:%S')
+    dt_string = datetime_obj.strftime(STAMP_FORMAT)
+    text_color = tuple(text_color)
+    background_color = tuple(background_color)
+    canvas_size = canvas_size or image.size
     
-    # Создаем объект для рисования
-    draw = ImageDraw.Draw(image, 'RGBA')
+    if image.mode == 'RGB':
+        # Готовый тайл штампа (кэшируется для серий снимков с одинаковым временем)
+        tile, (tile_x, tile_y), text_size = get_stamp_tile(dt_string, font_size, font_name,
+                                                           text_color, background_color)
+        x, y = get_stamp_position(position, canvas_size, text_size, margin_x, margin_y)
+        x, y = x - offset[0], y - offset[1]
+        
+        # Накладываем тайл только на область штампа
+        image.paste(tile, (x + tile_x, y + tile_y), tile)
+    else:
+        # Для остальных режимов (RGBA, L, P...) рисуем прямо на изображении
+        draw = ImageDraw.Draw(image, 'RGBA')
+        
+        # Используем кроссплатформенную функцию выбора шрифта
+        font = get_system_font(font_size, font_name)
+        
+        # Получаем маску текста (из атласа глифов) и ее размеры
+        text_mask, bbox = get_stamp_text_layout(dt_string, font, get_glyph_atlas(font_size, font_name))
+        text_size = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+        
+        # Определяем позицию текста
+        x, y = get_stamp_position(position, canvas_size, text_size, margin_x, margin_y)
+        x, y = x - offset[0], y - offset[1]
+        
+        # Рисуем полупрозрачный фон
+        box = get_stamp_box(text_size, font_size)
+        draw.rectangle([x + box[0], y + box[1], x + box[2], y + box[3]], fill=background_color)
+        
+        # Рисуем текст по готовой маске (эквивалентно draw.text)
+        draw.bitmap((x + bbox[0], y + bbox[1]), text_mask, fill=text_color)
+
+@contextmanager
+def replace_output_file(path):
+    """Запись файла результата через временный файл в той же папке.
     
-    # Используем кроссплатформенную функцию выбора шрифта
-    font = get_system_font(font_size, font_name)
+    Выдает путь временного файла (с тем же расширением); после успешной
+    записи он заменяет path (os.replace), при ошибке удаляется. Существующий
+    файл не перезаписывается по месту: результат может быть жесткой ссылкой
+    (режим дедупликации), и запись в него изменила бы все связанные пути.
+    Имя временного файла уникально для процесса и потока.
+    """
+    folder, name = os.path.split(path)
+    temp_path = os.path.join(folder, f'.{name}.{os.getpid()}-{threading.get_ident()}'
+                                     f'{os.path.splitext(name)[1]}')
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def save_stamped_image(image, output, output_path, jpeg_quality=95):
+    """Сохранение изображения со штампом вместе с EXIF и ICC-профилем исходника.
     
-    # Получаем размеры текста
-    bbox = draw.textbbox((0, 0), dt_string, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
+    output - путь или файловый объект (например, io.BytesIO); формат
+    определяется по расширению output_path.
+    """
+    save_options = get_metadata_save_options(image)
+    if output_path.lower().endswith('.jpg') or output_path.lower().endswith('.jpeg'):
+        save_options.update(get_jpeg_save_options(image, jpeg_quality))
+        image.save(output, 'JPEG', **save_options)
+    elif isinstance(output, str):
+        image.save(output, **save_options)
+    else:
+        extension = os.path.splitext(output_path)[1].lower()
+        image.save(output, Image.registered_extensions()[extension], **save_options)
+
+# Форматы, в которых несжатые пиксели лежат по вычислимым смещениям: штамп
+# наносится на копию файла на месте, переписываются только строки под ним
+IN_PLACE_FORMATS = {'BMP': ('.bmp',), 'TIFF': ('.tif', '.tiff')}
+IN_PLACE_MODES = ('RGB', 'RGBA')
+
+def _raw_pixel_bytes(mode, rawmode):
+    """Байт на пиксель в упаковке rawmode (None - упаковка не поддерживается
+    или пиксель не кратен байту)"""
+    try:
+        packed = len(Image.new(mode, (8, 1)).tobytes('raw', rawmode))
+    except (ValueError, OSError):
+        return None
+    return packed // 8 if packed % 8 == 0 else None
+
+def get_in_place_layout(image, output_path):
+    """Расположение несжатых пикселей для нанесения штампа на месте.
     
-    # Определяем позицию текста
-    img_width, img_height = image.size
+    image - открытое (не декодированное) изображение. Возвращает список
+    (границы блока, смещение, rawmode, шаг строки, направление строк, байт на
+    пиксель) по блокам (полосам) файла или None, если формат, режим, сжатие
+    или расширение результата не позволяют патчить файл.
+    """
+    if image.format not in IN_PLACE_FORMATS or image.mode not in IN_PLACE_MODES:
+        return None
+    if not output_path.lower().endswith(IN_PLACE_FORMATS[image.format]):
+        return None
+    if image.format == 'TIFF':
+        # Только чередующиеся каналы; поворот обычный путь сбрасывает в EXIF,
+        # а копия файла сохранила бы его
+        if image.tag_v2.get(284, 1) != 1 or image.tag_v2.get(0x0112, 1) != 1:
+            return None
     
-    if position == 'top-left':
-        x, y = margin_x, margin_y
-    elif position == 'top-right':
-        x, y = img_width - text_width - margin_x, margin_y
-    elif position == 'bottom-left':
-        x, y = margin_x, img_height - text_height - margin_y
-    elif position == 'center':
-        x, y = (img_width - text_width) // 2, (img_height - text_height) // 2
-    elif position == 'center-top':
-        x, y = (img_width - text_width) // 2, margin_y
-    elif position == 'center-bottom':
-        x, y = (img_width - text_width) // 2, img_height - text_height - margin_y
-    else:  # bottom-right (по умолчанию)
-        x, y = img_width - text_width - margin_x, img_height - text_height - margin_y
+    layout = []
+    for codec, extents, offset, args in image.tile:
+        if codec != 'raw' or not isinstance(args, tuple) or len(args) != 3:
+            return None
+        rawmode, stride, orientation = args
+        pixel_bytes = _raw_pixel_bytes(image.mode, rawmode)
+        if pixel_bytes is None:
+            return None
+        if not stride:
+            stride = (extents[2] - extents[0]) * pixel_bytes
+        layout.append((extents, offset, rawmode, stride, orientation, pixel_bytes))
+    return layout or None
+
+def get_stamp_region(datetime_obj, image_size, font_size=30, position='bottom-right',
+                     margin_x=10, margin_y=10, font_name=None):
+    """Прямоугольник кадра, который затрагивает штамп (left, top, right, bottom)"""
+    dt_string = datetime_obj.strftime(STAMP_FORMAT)
+    font = get_system_font(font_size, font_name)
+    text_mask, bbox = get_stamp_text_layout(dt_string, font, get_glyph_atlas(font_size, font_name))
+    text_size = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+    box = get_stamp_box(text_size, font_size)
+    x, y = get_stamp_position(position, image_size, text_size, margin_x, margin_y)
     
-    # Рисуем полупрозрачный фон
-    padding = 10
-    # Смещаем рамку вниз относительно текста - размер смещения пропорционален размеру шрифта
-    frame_y_offset = font_size // 4  # 1/4 от размера шрифта для оптимального смещения
-    draw.rectangle([x - padding, y - padding + frame_y_offset, 
-                   x + text_width + padding, y + text_height + padding + frame_y_offset],
-                  fill=background_color)
+    # Объединение фона и маски текста, обрезанное по кадру
+    left = max(0, x + min(box[0], bbox[0]))
+    top = max(0, y + min(box[1], bbox[1]))
+    right = min(image_size[0], x + max(box[2] + 1, bbox[0] + text_mask.size[0]))
+    bottom = min(image_size[1], y + max(box[3] + 1, bbox[1] + text_mask.size[1]))
+    return left, top, right, bottom
+
+def stamp_in_place(path, layout, image_size, mode, datetime_obj, font_size=30, position='bottom-right',
+                   text_color=(255, 255, 255), background_color=(0, 0, 0, 150),
+                   margin_x=10, margin_y=10, font_name=None):
+    """Нанесение штампа прямо в файл path (копию исходника) через mmap.
     
-    # Рисуем текст
-    draw.text((x, y), dt_string, font=font, fill=text_color)
+    Декодируются и переписываются только пиксели под штампом - несколько
+    килобайт ввода-вывода вместо полного декодирования и кодирования.
+    layout - результат get_in_place_layout.
+    """
+    left, top, right, bottom = get_stamp_region(datetime_obj, image_size, font_size, position,
+                                                margin_x, margin_y, font_name)
+    if left >= right or top >= bottom:
+        return
     
-    # Сохраняем изображение
-    if output_path.lower().endswith('.jpg') or output_path.lower().endswith('.jpeg'):
-        image.save(output_path, 'JPEG', quality=95)
+    with open(path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mapped:
+        region = Image.new(mode, (right - left, bottom - top))
+        pieces = []
+        for (x0, y0, x1, y1), offset, rawmode, stride, orientation, pixel_bytes in layout:
+            # Пересечение блока файла с областью штампа
+            px0, py0 = max(left, x0), max(top, y0)
+            px1, py1 = min(right, x1), min(bottom, y1)
+            if px0 >= px1 or py0 >= py1:
+                continue
+            row_bytes = (px1 - px0) * pixel_bytes
+            starts = []
+            for y in range(py0, py1):
+                # Строки BMP хранятся снизу вверх (orientation = -1)
+                row = y - y0 if orientation >= 0 else y1 - 1 - y
+                start = offset + row * stride + (px0 - x0) * pixel_bytes
+                if start + row_bytes > len(mapped):
+                    raise ValueError("файл короче, чем указано в заголовке")
+                starts.append(start)
+            data = b''.join(mapped[start:start + row_bytes] for start in starts)
+            piece = Image.frombuffer(mode, (px1 - px0, py1 - py0), data, 'raw', rawmode, 0, 1)
+            region.paste(piece, (px0 - left, py0 - top))
+            pieces.append(((px0 - left, py0 - top, px1 - left, py1 - top), rawmode, row_bytes, starts))
+        
+        draw_datetime_stamp(region, datetime_obj, font_size, position, text_color, background_color,
+                            margin_x, margin_y, font_name, canvas_size=image_size, offset=(left, top))
+        
+        # Запись измененных пикселей обратно в те же строки файла
+        for box, rawmode, row_bytes, starts in pieces:
+            data = region.crop(box).tobytes('raw', rawmode)
+            for index, start in enumerate(starts):
+                mapped[start:start + row_bytes] = data[index * row_bytes:(index + 1) * row_bytes]
+        mapped.flush()
+
+def _stamp_image(image, datetime_obj, *stamp_args):
+    """Декодирование и штамп с раздельными замерами стадий (см. StampMetrics)"""
+    with StampMetrics.stage('decode'):
+        image.load()
+    with StampMetrics.stage('draw'):
+        draw_datetime_stamp(image, datetime_obj, *stamp_args)
+
+def add_datetime_watermark(input_path, output_path, datetime_obj, font_size=30, 
+                          position='bottom-right', opacity=0.7, text_color=(255, 255, 255),
+                          background_color=(0, 0, 0, 150), margin_x=10, margin_y=10, font_name=None,
+                          jpeg_quality=95, source_data=None, source_stat=None, preserve_metadata=True,
+                          in_place=True):
+    """Добавление водяного знака с датой и временем
+    
+    jpeg_quality - качество сохранения JPEG (1-100) или 'keep': переиспользовать
+    таблицы квантования и субдискретизацию исходного JPEG.
+    source_data - байты исходного файла, если он уже прочитан (read_source_file).
+    source_stat - результат os.stat исходника; preserve_metadata=False - метаданные
+    переносит вызывающий код (preserve_file_metadata) после записи файла.
+    in_place - для несжатых BMP/TIFF копировать файл и патчить только область
+    штампа (см. stamp_in_place) вместо полного декодирования и кодирования.
+    """
+    image = open_source_image(input_path, source_data)
+    layout = get_in_place_layout(image, output_path) if in_place else None
+    if layout is not None:
+        if os.path.abspath(input_path) == os.path.abspath(output_path) and os.stat(output_path).st_nlink == 1:
+            # Перезапись исходника без других ссылок на него - патчим сам файл
+            with StampMetrics.stage('in_place'):
+                stamp_in_place(output_path, layout, image.size, image.mode, datetime_obj, font_size,
+                               position, text_color, background_color, margin_x, margin_y, font_name)
+        else:
+            with replace_output_file(output_path) as temp_path:
+                with StampMetrics.stage('copy'):
+                    if source_data is not None:
+                        with open(temp_path, 'wb') as f:
+                            f.write(source_data)
+                    else:
+                        shutil.copyfile(input_path, temp_path)
+                with StampMetrics.stage('in_place'):
+                    stamp_in_place(temp_path, layout, image.size, image.mode, datetime_obj, font_size,
+                                   position, text_color, background_color, margin_x, margin_y, font_name)
+        StampMetrics.count('files_in_place')
     else:
-        image.save(output_path)
+        _stamp_image(image, datetime_obj, font_size, position, text_color, background_color,
+                     margin_x, margin_y, font_name)
+        with StampMetrics.stage('encode'), replace_output_file(output_path) as temp_path:
+            save_stamped_image(image, temp_path, output_path, jpeg_quality)
     
     # Сохраняем метаданные исходного файла
-    preserve_file_metadata(input_path, output_path)
+    if preserve_metadata:
+        preserve_file_metadata(input_path, output_path, source_stat)
+
+def encode_datetime_watermark(input_path, output_path, datetime_obj, font_size=30,
+                              position='bottom-right', text_color=(255, 255, 255),
+                              background_color=(0, 0, 0, 150), margin_x=10, margin_y=10,
+                              font_name=None, jpeg_quality=95, source_data=None):
+    """То же, что add_datetime_watermark, но результат возвращается байтами
+    в формате output_path, а не записывается на диск"""
+    image = open_source_image(input_path, source_data)
+    _stamp_image(image, datetime_obj, font_size, position, text_color, background_color,
+                 margin_x, margin_y, font_name)
+    output = io.BytesIO()
+    with StampMetrics.stage('encode'):
+        save_stamped_image(image, output, output_path, jpeg_quality)
+    return output.getvalue()
+
+# Задание и результат пакетной обработки (stamp_batch). Папка dest_path
+# должна существовать; source_stat - результат os.stat исходника или None.
+StampJob = namedtuple('StampJob', 'source_path dest_path source_stat')
+StampResult = namedtuple('StampResult', 'job success lines datetime_obj date_source error cpu_time')
+
+def _resolve_job_datetime(job, source_data, log):
+    """Дата для задания stamp_batch по умолчанию: имя файла -> EXIF -> время создания"""
+    return _resolve_datetime(job.source_path, os.path.basename(job.source_path), log, source_data)
+
+def encode_stamp_job(job, source_data, stamp_options, resolve_datetime=None, direct=False):
+    """Стадия обработки задания: дата, штамп и кодирование в памяти.
+    
+    stamp_options - параметры encode_datetime_watermark (font_size, position,
+    margin_x, margin_y, font_name, jpeg_quality). Возвращает (байты результата
+    или None, если дата не найдена, строки лога, дата, источник даты, время CPU).
+    direct=True - результат сразу записывается в файл (большие изображения),
+    вместо байтов возвращается True.
+    Функция модульного уровня - может выполняться в пуле процессов.
+    """
+    started = time.thread_time()
+    lines = []
+    datetime_obj, date_source = (resolve_datetime or _resolve_job_datetime)(job, source_data, lines.append)
+    encoded = None
+    # BMP и TIFF пишутся напрямую: для несжатых штамп наносится на месте
+    direct = direct or job.dest_path.lower().endswith(('.bmp', '.tif', '.tiff'))
+    if datetime_obj is not None and direct:
+        add_datetime_watermark(job.source_path, job.dest_path, datetime_obj, source_data=source_data,
+                               preserve_metadata=False, **stamp_options)
+        encoded = True
+    elif datetime_obj is not None:
+        encoded = encode_datetime_watermark(job.source_path, job.dest_path, datetime_obj,
+                                            source_data=source_data, **stamp_options)
+    return encoded, lines, datetime_obj, date_source, time.thread_time() - started
+
+def write_stamp_job(job, encoded, preserve_metadata=True):
+    """Стадия записи задания: файл результата (если он еще не записан,
+    encoded=True) и метаданные исходника"""
+    if encoded is not True:
+        with StampMetrics.stage('write'), replace_output_file(job.dest_path) as temp_path:
+            with open(temp_path, 'wb') as f:
+                f.write(encoded)
+    if preserve_metadata:
+        preserve_file_metadata(job.source_path, job.dest_path, job.source_stat)
+
+def run_stamp_job(job, stamp_options, resolve_datetime=None, preserve_metadata=True):
+    """Полная обработка задания в одном вызове: чтение, дата, штамп и запись.
+    
+    Для пула процессов: resolve_datetime должна быть функцией модульного
+    уровня. Ошибки не выбрасываются, а возвращаются в StampResult.error.
+    """
+    try:
+        source_data = read_source_file(job.source_path)
+        encoded, lines, datetime_obj, date_source, cpu_time = encode_stamp_job(
+            job, source_data, stamp_options, resolve_datetime)
+        # Исходные байты больше не нужны - освобождаем память до записи
+        del source_data
+        if encoded is not None:
+            write_stamp_job(job, encoded, preserve_metadata)
+        return StampResult(job, encoded is not None, lines, datetime_obj, date_source, None, cpu_time)
+    except Exception as e:
+        return StampResult(job, False, [], None, None, e, 0.0)
+
+def stamp_batch(jobs, font_size=30, position='bottom-right', margin_x=10, margin_y=10, font_name=None,
+                jpeg_quality=95, workers=0, queue_size=None, resolve_datetime=None, preserve_metadata=True,
+                memory_budget=None):
+    """Пакетная обработка конвейером: чтение, штамп и запись в отдельных потоках
+    
+    jobs - итерируемые задания с атрибутами source_path, dest_path, source_stat
+    (StampJob); перебираются лениво, в потоке чтения. workers - число потоков
+    декодирования, штампа и кодирования (0 - по числу ядер), queue_size -
+    размер очередей между стадиями (см. StampPipeline.run_pipeline).
+    resolve_datetime(job, source_data, log) -> (дата, источник даты); если дата
+    не найдена (None), файл не записывается.
+    
+    Выдает StampResult в порядке заданий: lines - строки лога определения
+    даты, error - исключение при чтении, обработке или записи, cpu_time -
+    время CPU потока обработки. Закрытие генератора прерывает обработку.
+    
+    memory_budget - бюджет памяти в байтах: файлы допускаются в работу по
+    оценке estimate_stamp_memory, пока суммарная оценка в него помещается;
+    большие изображения обрабатываются через файлы.
+    """
+    stamp_options = dict(font_size=font_size, position=position, margin_x=margin_x,
+                         margin_y=margin_y, font_name=font_name, jpeg_quality=jpeg_quality)
+    budget = StampPipeline.MemoryBudget(memory_budget) if memory_budget else None
+    direct_paths = set()
+    
+    def cost(job):
+        try:
+            size = job.source_stat.st_size if job.source_stat is not None else None
+            memory, direct = estimate_stamp_memory(job.source_path, size)
+        except OSError:
+            return 0  # Ошибку доступа сообщит чтение файла
+        if direct:
+            direct_paths.add(job.dest_path)
+        return memory
+    
+    def read(job):
+        if job.dest_path in direct_paths:
+            return None
+        return read_source_file(job.source_path)
+    
+    def process(job, source_data):
+        return encode_stamp_job(job, source_data, stamp_options, resolve_datetime,
+                                direct=job.dest_path in direct_paths)
+    
+    def write(job, payload):
+        encoded = payload[0]
+        direct_paths.discard(job.dest_path)
+        if encoded is not None:
+            write_stamp_job(job, encoded, preserve_metadata)
+        # Байты результата дальше не нужны - не держим их в очереди результатов
+        return encoded is not None, *payload[1:]
+    
+    for job, result, error in StampPipeline.run_pipeline(jobs, read, process, write,
+                                                         workers=resolve_workers(workers),
+                                                         queue_size=queue_size,
+                                                         budget=budget, cost=cost):
+        if error is not None:
+            yield StampResult(job, False, [], None, None, error, 0.0)
+        else:
+            success, lines, datetime_obj, date_source, cpu_time = result
+            yield StampResult(job, success, lines, datetime_obj, date_source, None, cpu_time)
 
 def process_images(input_folder, output_folder=None, overwrite=False, 
-                  font_size=30, position='bottom-right'):
+                  font_size=30, position='bottom-right', jpeg_quality=95):
     """Обработка всех изображений в папке"""
     
     if output_folder is None:
@@ -450,15 +1373,23 @@ def process_images(input_folder, output_folder=None, overwrite=False,
                 output_filename = f"watermarked_{filename}"
                 output_path = os.path.join(output_folder, output_filename)
             
+            # Читаем файл один раз: байты нужны и для EXIF, и для декодирования
+            try:
+                source_data = read_source_file(input_path)
+            except OSError as e:
+                print(f"Ошибка при обработке {filename}: {e}")
+                error_count += 1
+                continue
+            
             # Получаем дату и время разными способами
             datetime_obj = None
             
             # 1. Пробуем получить из EXIF
-            datetime_obj = get_datetime_from_exif(input_path)
+            datetime_obj = get_datetime_from_exif(input_path, source_data)
             
             # 2. Если нет в EXIF, пробуем из имени файла
             if datetime_obj is None:
-                datetime_obj = get_datetime_from_filename(filename)
+                datetime_obj = get_datetime_from_filename(filename, input_folder)
             
             # 3. Если все еще нет, используем время создания файла
             if datetime_obj is None:
@@ -467,7 +1398,8 @@ def process_images(input_folder, output_folder=None, overwrite=False,
             if datetime_obj:
                 try:
                     add_datetime_watermark(input_path, output_path, datetime_obj, 
-                                          font_size, position)
+                                          font_size, position, jpeg_quality=jpeg_quality,
+                                          source_data=source_data)
                     print(f"Обработан: {filename} -> {datetime_obj}")
                     processed_count += 1
                 except Exception as e:
@@ -481,8 +1413,156 @@ def process_images(input_folder, output_folder=None, overwrite=False,
     print(f"Успешно: {processed_count}")
     print(f"С ошибками: {error_count}")
 
-def process_images_with_structure(source_root, dest_root, font_size=30, position='bottom-right', margin_x=10, margin_y=10, font_name=None):
-    """Обработка изображений с сохранением структуры папок"""
+def _resolve_datetime(source_path, filename, log, source_data=None):
+    """Определение даты и времени файла: имя файла -> EXIF -> время создания"""
+    datetime_obj = None
+    date_source = ""
+    
+    # 1. Пробуем получить из имени файла (ПРИОРИТЕТ)
+    datetime_obj = get_datetime_from_filename(filename, os.path.dirname(source_path))
+    if datetime_obj:
+        date_source = "имя файла"
+        log(f"  📅 Дата из имени файла: {datetime_obj}")
+    
+    # 2. Если нет в имени файла, пробуем из EXIF
+    if datetime_obj is None:
+        datetime_obj = get_datetime_from_exif(source_path, source_data)
+        if datetime_obj:
+            date_source = "EXIF"
+            log(f"  📅 Дата из EXIF: {datetime_obj}")
+    
+    # 3. Если все еще нет, используем время создания файла
+    if datetime_obj is None:
+        datetime_obj = get_file_creation_time(source_path)
+        if datetime_obj:
+            date_source = "время создания файла"
+            log(f"  📅 Дата из времени создания: {datetime_obj}")
+    
+    return datetime_obj, date_source
+
+def _process_structure_file(source_path, dest_path, display_path, font_size=30, position='bottom-right',
+                            margin_x=10, margin_y=10, font_name=None, jpeg_quality=95, source_stat=None,
+                            direct=False):
+    """Обработка одного файла в режиме сохранения структуры.
+    
+    Возвращает (успех, строки лога) - функция выполняется и в дочерних процессах,
+    поэтому вывод собирается в список и печатается вызывающей стороной.
+    source_stat - уже полученный stat исходника (инкрементальный режим).
+    direct=True - файл не читается в память целиком (большие изображения).
+    """
+    lines = []
+    filename = os.path.basename(source_path)
+    
+    # Читаем файл один раз: байты нужны и для EXIF, и для декодирования
+    source_data = None
+    try:
+        if not direct:
+            source_data = read_source_file(source_path)
+    except OSError as e:
+        lines.append(f"Ошибка при обработке {display_path}: {e}")
+        return False, lines
+    
+    # Получаем дату и время разными способами
+    datetime_obj, date_source = _resolve_datetime(source_path, filename, lines.append, source_data)
+    
+    # Выводим информацию о том, какая дата будет использована
+    if datetime_obj:
+        lines.append(f"  ✅ Используется дата: {datetime_obj} (источник: {date_source})")
+    else:
+        lines.append(f"  ❌ Не удалось определить дату для файла")
+        lines.append(f"Не удалось определить дату для: {display_path}")
+        return False, lines
+    
+    try:
+        add_datetime_watermark(source_path, dest_path, datetime_obj, 
+                              font_size, position, margin_x=margin_x, margin_y=margin_y, font_name=font_name,
+                              jpeg_quality=jpeg_quality, source_data=source_data,
+                              source_stat=source_stat)
+        
+        # Выводим параметры штампа
+        lines.append(f"  🎨 Параметры штампа: шрифт={font_size}px, позиция={position}, отступы={margin_x}x{margin_y}px")
+        lines.append(f"Обработан: {display_path} -> {datetime_obj} ({date_source})")
+        return True, lines
+    except Exception as e:
+        lines.append(f"Ошибка при обработке {display_path}: {e}")
+        return False, lines
+
+def _iter_structure_tasks(source_root, dest_root, supported_formats, scan_threads=1):
+    """Обход дерева исходной папки: (исходный путь, путь назначения,
+    относительный путь, stat исходника)"""
+    created_folder = None
+    for scanned in ImageScanner.iter_images(source_root, supported_formats, with_stat=True,
+                                            exclude=(dest_root,), threads=scan_threads):
+        if scanned.rel_dir == '.':
+            dest_folder = dest_root
+        else:
+            dest_folder = os.path.join(dest_root, scanned.rel_dir)
+        
+        # Создаем папку назначения только при необходимости (один раз на папку)
+        if dest_folder != created_folder:
+            os.makedirs(dest_folder, exist_ok=True)
+            created_folder = dest_folder
+        yield (scanned.path, os.path.join(dest_folder, scanned.name),
+               os.path.join(scanned.rel_dir, scanned.name), scanned.stat)
+
+def resolve_workers(workers):
+    """Нормализация числа рабочих процессов (0 или None - по числу ядер)"""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+# Задача обработки одного файла в режиме сохранения структуры. source_stat и
+# manifest_key заполняются в инкрементальном режиме, original - путь исходника
+# с тем же содержимым, результат которого переиспользуется (дедупликация).
+# memory и direct - оценка памяти и обработка через файлы (бюджет памяти).
+StructureTask = namedtuple('StructureTask', 'source_path dest_path display_path source_stat manifest_key '
+                                            'original memory direct', defaults=(0, False))
+
+def _run_structure_task(task, stamp_options):
+    """Обработка задачи: (успех, строки лога, затраченное время CPU)"""
+    started = time.process_time()
+    success, lines = _process_structure_file(task.source_path, task.dest_path, task.display_path,
+                                             source_stat=task.source_stat, direct=task.direct,
+                                             **stamp_options)
+    return success, lines, time.process_time() - started
+
+def _run_pooled_structure_task(task, stamp_options):
+    """_run_structure_task в процессе пула: к результату добавляются замеры стадий"""
+    return (*_run_structure_task(task, stamp_options), StampMetrics.drain_observations())
+
+def process_images_with_structure(source_root, dest_root, font_size=30, position='bottom-right', margin_x=10, margin_y=10, font_name=None,
+                                  workers=1, max_in_flight=None, jpeg_quality=95,
+                                  incremental=False, force_rebuild=False, dedup=None, scan_threads=1,
+                                  pipeline=False, memory_budget=None):
+    """Обработка изображений с сохранением структуры папок
+    
+    workers - число процессов для параллельной обработки (1 - последовательно,
+    0 - по числу ядер). max_in_flight ограничивает число файлов, одновременно
+    находящихся в очереди пула (по умолчанию workers * 2); результаты
+    выводятся в порядке обхода папок. jpeg_quality - см. add_datetime_watermark.
+    
+    incremental - вести манифест в папке назначения (см. StampManifest) и
+    пропускать файлы, не изменившиеся с прошлого запуска при тех же параметрах.
+    force_rebuild - обработать все файлы заново и пересоздать манифест.
+    
+    dedup - 'hardlink' или 'copy': одинаковые по содержимому исходники с той же
+    датой штампа обрабатываются один раз, остальные результаты - жесткие ссылки
+    на первый (общие метаданные) или копии с собственными метаданными.
+    
+    scan_threads - число потоков обхода папок (больше 1 - для сетевых папок,
+    см. ImageScanner.scan_images_parallel; порядок файлов при этом не
+    сохраняется).
+    
+    pipeline - обработка конвейером (stamp_batch) в одном процессе: чтение,
+    штамп и запись идут в разных потоках, workers - число потоков штампа.
+    
+    memory_budget - бюджет памяти в байтах для параллельной обработки: файлы
+    допускаются в работу по оценке декодированного размера (см.
+    estimate_stamp_memory), большие изображения обрабатываются через файлы.
+    
+    Если включены замеры (StampMetrics.enable_metrics), сводка сбрасывается в
+    начале и печатается в конце обработки.
+    """
     
     if not os.path.exists(source_root):
         print(f"Ошибка: Исходная папка '{source_root}' не существует!")
@@ -491,77 +1571,229 @@ def process_images_with_structure(source_root, dest_root, font_size=30, position
     # Создаем только корневую папку назначения
     os.makedirs(dest_root, exist_ok=True)
     
-    supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
+    if StampMetrics.metrics_enabled():
+        StampMetrics.reset_metrics()
+    supported_formats = ImageScanner.IMAGE_EXTENSIONS
     processed_count = 0
     error_count = 0
+    skipped_count = 0
+    duplicate_count = 0
+    saved_bytes = 0
+    saved_cpu = 0.0
     
-    # Рекурсивно обходим все папки
-    for root, dirs, files in os.walk(source_root):
-        # Вычисляем относительный путь от исходной папки
-        rel_path = os.path.relpath(root, source_root)
-        if rel_path == '.':
-            dest_folder = dest_root
+    stamp_options = dict(font_size=font_size, position=position, margin_x=margin_x,
+                         margin_y=margin_y, font_name=font_name, jpeg_quality=jpeg_quality)
+    tasks = _iter_structure_tasks(source_root, dest_root, supported_formats, scan_threads)
+    workers = resolve_workers(workers)
+    
+    manifest = None
+    if incremental or force_rebuild:
+        manifest = StampManifest.open_manifest(dest_root, rebuild=force_rebuild)
+        settings_key = StampManifest.get_settings_key(
+            **stamp_options, custom_patterns=get_custom_filename_patterns())
+    
+    # Бюджет памяти пула процессов; конвейер оценивает файлы сам (stamp_batch)
+    budget = None
+    if memory_budget and not pipeline:
+        budget = StampPipeline.MemoryBudget(memory_budget)
+    
+    duplicates = None
+    finished = {}  # исходник-оригинал -> (путь результата, время CPU)
+    if dedup:
+        # Дата штампа - часть ключа: одинаковые кадры с разными именами
+        # могут получить разные даты
+        duplicates = StampDedup.DuplicateIndex(
+            extra_key=lambda path: _resolve_datetime(path, os.path.basename(path), lambda line: None)[0])
+    
+    def pending_tasks():
+        """Задачи с учетом манифеста и дубликатов"""
+        nonlocal skipped_count
+        for source_path, dest_path, display_path, source_stat in StampMetrics.timed_iter('scan', tasks):
+            if source_stat is None or (manifest is None and duplicates is None and budget is None):
+                # Без stat ошибку доступа сообщит обработка файла
+                yield StructureTask(source_path, dest_path, display_path, source_stat, None, None)
+                continue
+            key = None
+            if manifest is not None:
+                key = StampManifest.get_manifest_key(source_root, source_path)
+                if (not force_rebuild and os.path.exists(dest_path)
+                        and StampManifest.is_unchanged(manifest, key, source_stat, settings_key)):
+                    skipped_count += 1
+                    StampMetrics.count('files_skipped')
+                    continue
+            original = None
+            if duplicates is not None:
+                try:
+                    with StampMetrics.stage('dedup_hash'):
+                        original = duplicates.find_original(source_path, source_stat.st_size)
+                except OSError:
+                    pass  # Файл будет обработан как обычный
+            memory, direct = 0, False
+            if budget is not None and original is None:
+                try:
+                    memory, direct = estimate_stamp_memory(source_path, source_stat.st_size)
+                except OSError:
+                    pass  # Ошибку доступа сообщит обработка файла
+            yield StructureTask(source_path, dest_path, display_path, source_stat, key, original,
+                                memory, direct)
+    
+    def place_duplicate(task):
+        """Результат для дубликата: ссылка или копия готового файла оригинала"""
+        nonlocal duplicate_count, saved_bytes, saved_cpu
+        if task.original not in finished:
+            # Оригинал не обработан (ошибка) - обрабатываем файл сам
+            return _run_structure_task(task, stamp_options)
+        original_dest, cpu_time = finished[task.original]
+        try:
+            hardlinked = StampDedup.link_or_copy(original_dest, task.dest_path, hardlink=dedup == 'hardlink')
+            if not hardlinked:
+                preserve_file_metadata(task.source_path, task.dest_path, task.source_stat)
+        except OSError as e:
+            return False, [f"Ошибка при обработке {task.display_path}: {e}"], 0.0
+        duplicate_count += 1
+        StampMetrics.count('duplicates')
+        saved_bytes += os.path.getsize(task.dest_path) if hardlinked else 0
+        saved_cpu += cpu_time
+        how = 'жесткая ссылка' if hardlinked else 'копия'
+        return True, [f"Дубликат: {task.display_path} ({how} на результат {os.path.basename(task.original)})"], 0.0
+    
+    def report(task, success, lines, cpu_time):
+        nonlocal processed_count, error_count
+        for line in lines:
+            print(line)
+        StampMetrics.count('files_processed' if success else 'files_failed')
+        if success:
+            processed_count += 1
+            if duplicates is not None and task.original not in finished:
+                finished[task.original or task.source_path] = (task.dest_path, cpu_time)
+            if task.manifest_key is not None:
+                StampManifest.record_processed(manifest, task.manifest_key, task.source_stat, settings_key)
         else:
-            dest_folder = os.path.join(dest_root, rel_path)
-        
-        # Обрабатываем файлы в текущей папке
-        for filename in files:
-            if filename.lower().endswith(supported_formats):
-                source_path = os.path.join(root, filename)
-                dest_path = os.path.join(dest_folder, filename)
-                
-                # Создаем папку назначения только при необходимости
-                os.makedirs(dest_folder, exist_ok=True)
-                
-                # Получаем дату и время разными способами
-                datetime_obj = None
-                date_source = ""
-                
-                # 1. Пробуем получить из имени файла (ПРИОРИТЕТ)
-                datetime_obj = get_datetime_from_filename(filename)
-                if datetime_obj:
-                    date_source = "имя файла"
-                    print(f"  📅 Дата из имени файла: {datetime_obj}")
-                
-                # 2. Если нет в имени файла, пробуем из EXIF
-                if datetime_obj is None:
-                    datetime_obj = get_datetime_from_exif(source_path)
-                    if datetime_obj:
-                        date_source = "EXIF"
-                        print(f"  📅 Дата из EXIF: {datetime_obj}")
-                
-                # 3. Если все еще нет, используем время создания файла
-                if datetime_obj is None:
-                    datetime_obj = get_file_creation_time(source_path)
-                    if datetime_obj:
-                        date_source = "время создания файла"
-                        print(f"  📅 Дата из времени создания: {datetime_obj}")
-                
-                # Выводим информацию о том, какая дата будет использована
-                if datetime_obj:
-                    print(f"  ✅ Используется дата: {datetime_obj} (источник: {date_source})")
-                else:
-                    print(f"  ❌ Не удалось определить дату для файла")
-                
-                if datetime_obj:
-                    try:
-                        add_datetime_watermark(source_path, dest_path, datetime_obj, 
-                                              font_size, position, margin_x=margin_x, margin_y=margin_y, font_name=font_name)
-                        
-                        # Выводим параметры штампа
-                        print(f"  🎨 Параметры штампа: шрифт={font_size}px, позиция={position}, отступы={margin_x}x{margin_y}px")
-                        print(f"Обработан: {os.path.join(rel_path, filename)} -> {datetime_obj} ({date_source})")
-                        processed_count += 1
-                    except Exception as e:
-                        print(f"Ошибка при обработке {os.path.join(rel_path, filename)}: {e}")
-                        error_count += 1
-                else:
-                    print(f"Не удалось определить дату для: {os.path.join(rel_path, filename)}")
-                    error_count += 1
+            error_count += 1
+    
+    try:
+        if pipeline:
+            _run_structure_pipeline(pending_tasks(), stamp_options, report, place_duplicate,
+                                    workers, max_in_flight, memory_budget)
+        else:
+            _run_structure_tasks(pending_tasks(), stamp_options, report, place_duplicate,
+                                 workers, max_in_flight, budget)
+    finally:
+        if manifest is not None:
+            StampManifest.close_manifest(manifest)
     
     print(f"\nОбработка с сохранением структуры завершена!")
     print(f"Успешно: {processed_count}")
     print(f"С ошибками: {error_count}")
+    if manifest is not None:
+        print(f"Пропущено без изменений: {skipped_count}")
+    if budget is not None and workers > 1:
+        print(f"Пиковая оценка памяти: {budget.peak / (1024 * 1024):.0f} МБ "
+              f"(бюджет {memory_budget / (1024 * 1024):.0f} МБ)")
+    if duplicates is not None:
+        print(f"Дубликатов: {duplicate_count} (сэкономлено на диске: {saved_bytes / (1024 * 1024):.1f} МБ, "
+              f"CPU: {saved_cpu:.1f} с; хэшировано {duplicates.hashed_files} файлов, "
+              f"{duplicates.hashed_bytes / (1024 * 1024):.1f} МБ)")
+    if StampMetrics.metrics_enabled():
+        print()
+        for line in StampMetrics.format_report():
+            print(line)
+
+def _run_structure_tasks(tasks, stamp_options, report, place_duplicate, workers, max_in_flight=None,
+                         budget=None):
+    """Выполнение задач последовательно или в пуле процессов с выводом по порядку.
+    
+    Дубликаты (task.original) не отправляются в пул: их результат создается
+    place_duplicate в момент вывода, когда оригинал уже обработан.
+    budget - MemoryBudget: задача отправляется в пул, когда ее оценка памяти
+    (task.memory) помещается в бюджет; до этого выводятся готовые результаты.
+    """
+    if workers == 1:
+        for task in tasks:
+            if task.original is not None:
+                report(task, *place_duplicate(task))
+            else:
+                report(task, *_run_structure_task(task, stamp_options))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        if max_in_flight is None:
+            max_in_flight = workers * 2
+        max_in_flight = max(workers, max_in_flight)
+        print(f"Параллельная обработка: {workers} процессов")
+        
+        def report_future(future, task):
+            if future is None:
+                report(task, *place_duplicate(task))
+                return
+            try:
+                *result, observations = future.result()
+                StampMetrics.merge_observations(observations)
+            except Exception as e:
+                result = False, [f"Ошибка при обработке {task.display_path}: {e}"], 0.0
+            if budget is not None:
+                budget.release(task.memory)
+            report(task, *result)
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_process,
+                                 initargs=(get_custom_filename_patterns(),
+                                           StampMetrics.metrics_enabled())) as executor:
+            # Очередь задач в порядке обхода: ждем самую старую, когда очередь заполнена
+            pending = deque()
+            for task in tasks:
+                future = None
+                if task.original is None:
+                    # Ждем освобождения памяти, выводя готовые результаты по порядку
+                    while budget is not None and not budget.try_acquire(task.memory):
+                        report_future(*pending.popleft())
+                    future = executor.submit(_run_pooled_structure_task, task, stamp_options)
+                pending.append((future, task))
+                if len(pending) >= max_in_flight:
+                    report_future(*pending.popleft())
+            while pending:
+                report_future(*pending.popleft())
+
+def _run_structure_pipeline(tasks, stamp_options, report, place_duplicate, workers, queue_size=None,
+                            memory_budget=None):
+    """Выполнение задач конвейером stamp_batch с выводом по порядку.
+    
+    Задачи перебираются в потоке чтения конвейера; дубликаты в него не
+    попадают и обрабатываются place_duplicate, когда до них доходит вывод.
+    """
+    print(f"Конвейерная обработка: {workers} потоков")
+    order = deque()
+    
+    def originals():
+        for task in tasks:
+            order.append(task)
+            if task.original is None:
+                yield task
+    
+    def report_duplicates():
+        while order and order[0].original is not None:
+            task = order.popleft()
+            report(task, *place_duplicate(task))
+    
+    for result in stamp_batch(originals(), workers=workers, queue_size=queue_size,
+                              memory_budget=memory_budget, **stamp_options):
+        report_duplicates()
+        task = order.popleft()
+        lines = list(result.lines)
+        if result.datetime_obj is None and result.error is None:
+            lines.append(f"  ❌ Не удалось определить дату для файла")
+            lines.append(f"Не удалось определить дату для: {task.display_path}")
+        elif result.error is not None:
+            if result.datetime_obj is not None:
+                lines.append(f"  ✅ Используется дата: {result.datetime_obj} (источник: {result.date_source})")
+            lines.append(f"Ошибка при обработке {task.display_path}: {result.error}")
+        else:
+            lines.append(f"  ✅ Используется дата: {result.datetime_obj} (источник: {result.date_source})")
+            lines.append(f"  🎨 Параметры штампа: шрифт={stamp_options['font_size']}px, "
+                         f"позиция={stamp_options['position']}, "
+                         f"отступы={stamp_options['margin_x']}x{stamp_options['margin_y']}px")
+            lines.append(f"Обработан: {task.display_path} -> {result.datetime_obj} ({result.date_source})")
+        report(task, result.success, lines, result.cpu_time)
+    report_duplicates()
 
 def main():
     parser = argparse.ArgumentParser(description='Добавление меток даты и времени на снимки')
@@ -582,6 +1814,36 @@ def main():
                        help='Отступ от краев по горизонтали (по умолчанию: 10)')
     parser.add_argument('--margin-y', type=int, default=10,
                        help='Отступ от краев по вертикали (по умолчанию: 10)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Число процессов для обработки в режиме --preserve-structure '
+                            '(по умолчанию: 1, 0 - по числу ядер)')
+    parser.add_argument('--pipeline', action='store_true',
+                       help='Конвейерная обработка в режиме --preserve-structure: чтение, штамп и запись '
+                            'в отдельных потоках одного процесса, --workers - число потоков штампа')
+    parser.add_argument('--memory-budget', type=int,
+                       help='Бюджет памяти в МБ для --workers/--pipeline: изображения допускаются в работу '
+                            'по оценке декодированного размера, большие обрабатываются через файлы')
+    parser.add_argument('--scan-threads', type=int, default=1,
+                       help='Число потоков обхода папок в режиме --preserve-structure; больше 1 '
+                            'ускоряет сетевые папки (SMB/NFS), порядок файлов не сохраняется (по умолчанию: 1)')
+    parser.add_argument('--filename-patterns',
+                       help='ini-файл с секцией [FilenamePatterns]: дополнительные шаблоны даты '
+                            'в именах файлов (имя = регулярное выражение)')
+    parser.add_argument('--jpeg-quality', type=parse_jpeg_quality, default=95,
+                       help="Качество JPEG (1-100) или keep - сохранить таблицы квантования "
+                            "и субдискретизацию исходника, чтобы уменьшить потери вне штампа "
+                            "(по умолчанию: 95)")
+    parser.add_argument('--incremental', action='store_true',
+                       help='Инкрементальный режим для --preserve-structure: пропускать файлы, '
+                            'не изменившиеся с прошлого запуска (манифест в папке вывода)')
+    parser.add_argument('--force-rebuild', action='store_true',
+                       help='Обработать все файлы заново и пересоздать манифест')
+    parser.add_argument('--dedup', nargs='?', const='hardlink', choices=['hardlink', 'copy'],
+                       help='Обрабатывать одинаковые исходные кадры один раз: остальные результаты - '
+                            'жесткие ссылки (по умолчанию) или копии для --preserve-structure')
+    parser.add_argument('--metrics', action='store_true',
+                       help='Замеры времени по стадиям (чтение, EXIF, шрифт, декодирование, штамп, '
+                            'кодирование, метаданные) и сводка в конце --preserve-structure')
     
     args = parser.parse_args()
     
@@ -589,15 +1851,33 @@ def main():
         print(f"Ошибка: Папка '{args.input_folder}' не существует!")
         return
     
+    if args.filename_patterns:
+        try:
+            load_filename_patterns(args.filename_patterns)
+        except (ValueError, re.error, configparser.Error) as e:
+            print(f"Ошибка в шаблонах имен файлов: {e}")
+            return
+    
+    if args.metrics:
+        StampMetrics.enable_metrics()
+    
     if args.preserve_structure:
         if not args.output:
             print("Ошибка: Для режима сохранения структуры необходимо указать папку вывода (-o)")
             return
         process_images_with_structure(args.input_folder, args.output, 
-                                    args.font_size, args.position, args.margin_x, args.margin_y)
+                                    args.font_size, args.position, args.margin_x, args.margin_y,
+                                    workers=args.workers, jpeg_quality=args.jpeg_quality,
+                                    incremental=args.incremental, force_rebuild=args.force_rebuild,
+                                    dedup=args.dedup, scan_threads=args.scan_threads,
+                                    pipeline=args.pipeline,
+                                    memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None)
     else:
         process_images(args.input_folder, args.output, args.overwrite, 
-                      args.font_size, args.position)
+                      args.font_size, args.position, jpeg_quality=args.jpeg_quality)
 
 if __name__ == "__main__":
+    # Поддержка пула процессов в собранном PyInstaller приложении
+    from multiprocessing import freeze_support
+    freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FSA-DateStamp - Асинхронный интерфейс пакетной обработки (asyncio)
+
+Для встраивания в асинхронные сервисы:
+
+    async for result in stamp_tree(source_root, dest_root, font_size=40):
+        print(result.job.source_path, result.success)
+
+Обход папок, чтение и запись файлов выполняются в пуле потоков, штамп и
+кодирование - в пуле процессов; цикл событий не блокируется. Число файлов
+в работе ограничено (max_in_flight), поэтому память не зависит от размера
+дерева: новый файл берется в работу, только когда потребитель забрал
+результат. Отмена задачи или прекращение перебора (aclose) останавливает
+обработку: запущенные операции записи дописываются до конца, новые не
+начинаются.
+"""
+
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import ImageScanner
+from DateStamp import (StampJob, StampResult, encode_stamp_job, write_stamp_job, read_source_file,
+                       resolve_workers, get_custom_filename_patterns, _init_worker_process)
+
+# Число потоков ввода-вывода по умолчанию (обход, чтение, запись)
+IO_THREADS = 4
+
+def _read_job(job):
+    """Чтение исходника; папка результата создается заранее"""
+    os.makedirs(os.path.dirname(job.dest_path), exist_ok=True)
+    return read_source_file(job.source_path)
+
+async def _stamp_job(loop, job, io_executor, cpu_executor, stamp_options):
+    """Обработка одного задания: чтение -> штамп в процессе -> запись"""
+    try:
+        source_data = await loop.run_in_executor(io_executor, _read_job, job)
+        encoded, lines, datetime_obj, date_source, cpu_time = await loop.run_in_executor(
+            cpu_executor, encode_stamp_job, job, source_data, stamp_options)
+        # Исходные байты больше не нужны - освобождаем память до записи
+        del source_data
+        if encoded is not None:
+            await loop.run_in_executor(io_executor, write_stamp_job, job, encoded)
+        return StampResult(job, encoded is not None, lines, datetime_obj, date_source, None, cpu_time)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return StampResult(job, False, [], None, None, e, 0.0)
+
+async def stamp_tree(source_root, dest_root, font_size=30, position='bottom-right', margin_x=10,
+                     margin_y=10, font_name=None, jpeg_quality=95, workers=0, io_threads=IO_THREADS,
+                     max_in_flight=None, scan_threads=1, cpu_executor=None):
+    """Асинхронный генератор результатов обработки дерева папок.
+
+    Структура папок source_root повторяется в dest_root, дата определяется
+    как в режиме сохранения структуры (имя файла -> EXIF -> время создания).
+    Выдает DateStamp.StampResult по мере готовности (порядок не сохраняется).
+
+    workers - число процессов штампа (0 - по числу ядер); cpu_executor -
+    готовый пул процессов сервиса вместо собственного (не закрывается).
+    max_in_flight - максимум файлов в работе (по умолчанию workers * 2).
+    scan_threads - см. ImageScanner.iter_images.
+    """
+    loop = asyncio.get_running_loop()
+    workers = resolve_workers(workers)
+    if max_in_flight is None:
+        max_in_flight = workers * 2
+    max_in_flight = max(1, max_in_flight)
+    stamp_options = dict(font_size=font_size, position=position, margin_x=margin_x,
+                         margin_y=margin_y, font_name=font_name, jpeg_quality=jpeg_quality)
+
+    io_executor = ThreadPoolExecutor(max_workers=io_threads)
+    own_cpu_executor = cpu_executor is None
+    if own_cpu_executor:
+        cpu_executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_process,
+                                           initargs=(get_custom_filename_patterns(),))
+    files = ImageScanner.iter_images(source_root, ImageScanner.IMAGE_EXTENSIONS, with_stat=True,
+                                     exclude=(dest_root,), threads=scan_threads)
+
+    def shutdown():
+        # Ожидание начатых операций (в том числе записи) и закрытие пулов;
+        # еще не начатые операции отменены вместе с задачами
+        ImageScanner.shutdown_executor(io_executor)
+        files.close()
+        if own_cpu_executor:
+            ImageScanner.shutdown_executor(cpu_executor)
+
+    pending = set()
+    exhausted = False
+    try:
+        while True:
+            # Новые файлы берутся в работу, пока не достигнут предел
+            while not exhausted and len(pending) < max_in_flight:
+                scanned = await loop.run_in_executor(io_executor, next, files, None)
+                if scanned is None:
+                    exhausted = True
+                    break
+                dest_path = os.path.join(dest_root, scanned.rel_dir, scanned.name)
+                job = StampJob(scanned.path, os.path.normpath(dest_path), scanned.stat)
+                pending.add(asyncio.ensure_future(
+                    _stamp_job(loop, job, io_executor, cpu_executor, stamp_options)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await asyncio.shield(loop.run_in_executor(None, shutdown))
+
+async def stamp_tree_summary(source_root, dest_root, **options):
+    """Обработка дерева целиком: (успешно, с ошибками)"""
+    processed_count = 0
+    error_count = 0
+    async for result in stamp_tree(source_root, dest_root, **options):
+        if result.success:
+            processed_count += 1
+        else:
+            error_count += 1
+    return processed_count, error_count
@@ -6,10 +6,60 @@ FSA-DateStamp GUI - Графический интерфейс для добав
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+from datetime import datetime
 import os
 import sys
+import time
+import queue
 import configparser
-from DateStamp import process_images_with_structure, get_available_fonts, create_stamp_preview
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from DateStamp import (process_images_with_structure, get_available_fonts, create_stamp_preview,
+                       load_filename_patterns, get_custom_filename_patterns, run_stamp_job, StampJob,
+                       get_datetime_from_exif, get_datetime_from_filename, resolve_workers,
+                       _init_worker_process)
+import ImageScanner
+import StampLog
+from StampPipeline import ProcessingControl
+
+GUI_IMAGE_EXTENSIONS = ImageScanner.IMAGE_EXTENSIONS + ('.gif',)
+
+# Потоки обработки не трогают виджеты: сообщения для интерфейса идут через
+# очередь, которую поток интерфейса разбирает по таймеру. Интервал разбора,
+# мс (он же - наибольшая частота обновления прогресса), максимум сообщений
+# и записей лога, выводимых в окно, за один разбор (остальные - на
+# следующих тиках без ожидания интервала)
+UI_POLL_INTERVAL_MS = 100
+UI_POLL_BATCH = 1000
+LOG_RENDER_BATCH = 1000
+# Поток обработки отправляет прогресс не чаще, чем раз в этот интервал, с
+PROGRESS_POST_INTERVAL = 0.1
+
+# Длина имени файла в строке состояния обработчиков
+STATUS_NAME_LENGTH = 24
+
+def resolve_image_datetime(job, source_data, log):
+    """Дата и время изображения для GUI: из EXIF или имени файла.
+    Функция модульного уровня - выполняется в процессах пула."""
+    datetime_obj = get_datetime_from_exif(job.source_path, source_data)
+    if datetime_obj is None:
+        datetime_obj = get_datetime_from_filename(os.path.basename(job.source_path),
+                                                  os.path.dirname(job.source_path))
+    return datetime_obj, None
+
+def format_duration(seconds):
+    """Длительность для строки состояния: 1:05:09 или 5:09"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+# Фильтры окна лога -> тип записей (None - все записи)
+LOG_FILTERS = {
+    "Все": None,
+    "Обработано": StampLog.LOG_PROCESSED,
+    "Пропущено": StampLog.LOG_SKIPPED,
+    "Ошибки": StampLog.LOG_ERROR,
+}
 
 class DateStampGUI:
     def __init__(self, root):
@@ -22,11 +72,18 @@ class DateStampGUI:
         # Инициализируем переменные для всплывающей подсказки и управления процессом
         self.tooltip = None
         self.is_processing = False
-        self.is_paused = False
-        self.should_cancel = False
+        # Пауза и отмена текущей обработки (новый объект на каждый запуск)
+        self.control = ProcessingControl()
         self.processed_count = 0
         self.total_count = 0
-        self.original_log_text = ""  # Сохраняем оригинальный текст лога
+        self.worker_states = []  # Имя файла в работе у каждого обработчика (None - свободен)
+        # Очередь сообщений интерфейсу из любых потоков (см. post_ui)
+        self.ui_queue = queue.SimpleQueue()
+        # Лог: буфер записей; для окна лога - записи, ждущие вывода с учетом
+        # фильтра, и (номер записи, число строк) уже показанных записей
+        self.log_buffer = StampLog.LogBuffer()
+        self.log_pending = deque()
+        self.log_view = deque()
         
         # Определяем путь к файлу настроек рядом с исполняемым файлом
         if getattr(sys, 'frozen', False):
@@ -45,7 +102,9 @@ class DateStampGUI:
             'position': 'center',
             'margin_x': 50,
             'margin_y': 30,
-            'window_geometry': '600x500+100+100'
+            'window_geometry': '600x500+100+100',
+            'scan_threads': 1,
+            'workers': 0
         }
         
         # Загружаем настройки
@@ -56,6 +115,9 @@ class DateStampGUI:
         
         # Применяем загруженные настройки
         self.apply_settings()
+        
+        # Запускаем разбор сообщений интерфейсу
+        self.root.after(UI_POLL_INTERVAL_MS, self._poll_ui)
     
     def create_widgets(self):
         """Создание элементов интерфейса"""
@@ -173,12 +235,28 @@ class DateStampGUI:
                                         textvariable=self.margin_y_var, width=8)
         self.margin_y_spin.pack(side=tk.LEFT)
         
+        # Параллельная обработка и обход папок на одной строке
+        processing_frame = ttk.Frame(main_frame)
+        processing_frame.grid(row=9, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        ttk.Label(processing_frame, text="Процессов (0 - по числу ядер):").pack(side=tk.LEFT, padx=(0, 5))
+        self.workers_var = tk.IntVar()
+        self.workers_spin = ttk.Spinbox(processing_frame, from_=0, to=64,
+                                        textvariable=self.workers_var, width=8)
+        self.workers_spin.pack(side=tk.LEFT, padx=(0, 20))
+        
+        ttk.Label(processing_frame, text="Потоков обхода папок:").pack(side=tk.LEFT, padx=(0, 5))
+        self.scan_threads_var = tk.IntVar()
+        self.scan_threads_spin = ttk.Spinbox(processing_frame, from_=1, to=32,
+                                             textvariable=self.scan_threads_var, width=8)
+        self.scan_threads_spin.pack(side=tk.LEFT)
+        
         # Разделитель
-        ttk.Separator(main_frame, orient='horizontal').grid(row=9, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=20)
+        ttk.Separator(main_frame, orient='horizontal').grid(row=10, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=20)
         
         # Кнопки
         button_frame = ttk.Frame(main_frame)
-        button_frame.grid(row=10, column=0, columnspan=3, pady=10)
+        button_frame.grid(row=11, column=0, columnspan=3, pady=10)
         
         ttk.Button(button_frame, text="Обработать изображения", 
                   command=self.process_images, style="Accent.TButton").pack(side=tk.LEFT, padx=(0, 10))
@@ -190,7 +268,7 @@ class DateStampGUI:
         # Статус
         self.status_var = tk.StringVar(value="Готов к работе")
         self.status_label = ttk.Label(main_frame, textvariable=self.status_var)
-        self.status_label.grid(row=11, column=0, columnspan=3, pady=5)
+        self.status_label.grid(row=12, column=0, columnspan=3, pady=5)
         
         # Привязка событий
         self.font_size_scale.configure(command=self.update_font_size_label)
@@ -201,6 +279,10 @@ class DateStampGUI:
         self.margin_x_var.trace('w', lambda *args: self.update_preview())
         self.margin_y_var.trace('w', lambda *args: self.update_preview())
         
+        # Параметры обработки переносятся в настройки сразу при изменении
+        self.workers_var.trace('w', lambda *args: self.update_processing_settings())
+        self.scan_threads_var.trace('w', lambda *args: self.update_processing_settings())
+        
         # Создаем предварительный просмотр после инициализации всех переменных
         self.update_preview()
         
@@ -374,32 +456,86 @@ class DateStampGUI:
         except Exception as e:
             print(f"Ошибка скрытия подсказки: {e}")
     
-    def log_message(self, message):
-        """Добавление сообщения в лог"""
+    def log_message(self, message, kind=None):
+        """Добавление сообщения в лог (можно вызывать из любого потока).
+        
+        kind - тип записи (StampLog.LOG_*), по умолчанию определяется по тексту.
+        Сообщение попадает в окно лога при следующем разборе очереди (_poll_ui).
+        """
+        self.post_ui('log', str(message), kind, datetime.now())
+    
+    def post_ui(self, kind, *args):
+        """Сообщение интерфейсу из любого потока: 'log' (текст, тип, время),
+        'status' (текст), 'progress' (см. _show_progress), 'finish' (см.
+        _finish_processing). Виджеты обновляет только _poll_ui."""
+        self.ui_queue.put((kind, args))
+    
+    def _poll_ui(self):
+        """Разбор очереди сообщений интерфейсу в потоке интерфейса.
+        
+        Прогресс и строка состояния объединяются: за один разбор выводится
+        только последнее значение, поэтому виджеты обновляются не чаще
+        UI_POLL_INTERVAL_MS, сколько бы файлов ни завершилось.
+        """
+        delay = UI_POLL_INTERVAL_MS
         try:
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            log_entry = f"[{timestamp}] {message}\n"
-            
-            # Добавляем в оригинальный текст
-            self.original_log_text += log_entry
-            
-            # Если фильтр не активен, добавляем в отображение
-            if hasattr(self, 'log_filter_var') and self.log_filter_var.get() == "Все":
-                self.log_text.insert(tk.END, log_entry)
-                self.log_text.see(tk.END)  # Прокрутка к концу
-            elif hasattr(self, 'log_filter_var'):
-                # Применяем текущий фильтр
-                self._apply_filter()
+            filter_kind = LOG_FILTERS.get(self.log_filter_var.get())
+            latest = None
+            for _ in range(UI_POLL_BATCH):
+                try:
+                    kind, args = self.ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == 'log':
+                    entry = self.log_buffer.append(*args)
+                    if filter_kind is None or entry.kind == filter_kind:
+                        self.log_pending.append(entry)
+                elif kind in ('progress', 'status'):
+                    latest = kind, args
+                elif kind == 'finish':
+                    latest = None
+                    self._finish_processing(*args)
             else:
-                # Если фильтр еще не инициализирован, просто добавляем
-                self.log_text.insert(tk.END, log_entry)
-                self.log_text.see(tk.END)
-            
-            self.root.update_idletasks()  # Обновление интерфейса
-            
+                delay = 1  # Очередь не разобрана - продолжаем без ожидания
+            
+            if latest is not None:
+                kind, args = latest
+                if kind == 'progress':
+                    self._show_progress(*args)
+                else:
+                    self.status_var.set(args[0])
+            if self.log_pending:
+                self._render_log_entries()
+                if self.log_pending:
+                    delay = 1
         except Exception as e:
-            print(f"Ошибка записи в лог: {e}")
+            print(f"Ошибка обновления интерфейса: {e}")
+        finally:
+            self.root.after(delay, self._poll_ui)
+    
+    def _render_log_entries(self):
+        """Вывод очередной пачки ждущих записей в окно лога"""
+        first_seq = self.log_buffer.first_seq
+        # Записи, вытесненные из буфера до вывода, не показываем
+        while self.log_pending and self.log_pending[0].seq < first_seq:
+            self.log_pending.popleft()
+        lines = []
+        while self.log_pending and len(lines) < LOG_RENDER_BATCH:
+            entry = self.log_pending.popleft()
+            text = StampLog.format_entry(entry)
+            lines.append(text)
+            self.log_view.append((entry.seq, text.count('\n') + 1))
+        if lines:
+            self.log_text.insert(tk.END, '\n'.join(lines) + '\n')
+        
+        # Записи, вытесненные из буфера, удаляем и из окна одним вызовом
+        removed_lines = 0
+        while self.log_view and self.log_view[0][0] < first_seq:
+            removed_lines += self.log_view.popleft()[1]
+        if removed_lines:
+            self.log_text.delete("1.0", f"{removed_lines + 1}.0")
+        if lines:
+            self.log_text.see(tk.END)  # Прокрутка к концу
     
     def update_image_count(self):
         """Обновление счетчика изображений"""
@@ -421,29 +557,23 @@ class DateStampGUI:
     
     def count_images(self, folder_path):
         """Подсчет количества изображений в папке"""
-        count = 0
-        image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif'}
-        
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                if os.path.splitext(file.lower())[1] in image_extensions:
-                    count += 1
-        return count
+        return ImageScanner.count_images(folder_path, GUI_IMAGE_EXTENSIONS,
+                                         threads=self.settings['scan_threads'])
     
     def toggle_pause(self):
         """Переключение паузы/продолжения"""
-        if self.is_paused:
-            self.is_paused = False
+        if self.control.paused:
+            self.control.resume()
             self.pause_button.config(text="Пауза")
             self.log_message("Обработка продолжена")
         else:
-            self.is_paused = True
+            self.control.pause()
             self.pause_button.config(text="Продолжить")
             self.log_message("Обработка приостановлена")
     
     def cancel_processing(self):
-        """Отмена обработки"""
-        self.should_cancel = True
+        """Отмена обработки: новые файлы не берутся, файлы в работе дорабатываются"""
+        self.control.cancel()
         self.log_message("Запрошена отмена обработки...")
         self.pause_button.config(state=tk.DISABLED)
         self.cancel_button.config(state=tk.DISABLED)
@@ -518,9 +648,27 @@ class DateStampGUI:
                 self.settings['margin_x'] = section.getint('margin_x', 50)
                 self.settings['margin_y'] = section.getint('margin_y', 30)
                 self.settings['window_geometry'] = section.get('window_geometry', '800x700+100+100')
+                self.settings['scan_threads'] = section.getint('scan_threads', 1)
+                self.settings['workers'] = section.getint('workers', 0)
                 
                 # Применяем геометрию окна сразу после загрузки
                 self.root.geometry(self.settings['window_geometry'])
+            
+            # Пользовательские шаблоны даты в именах файлов
+            if 'FilenamePatterns' in config:
+                try:
+                    load_filename_patterns(self.config_file)
+                except Exception as e:
+                    print(f"Ошибка загрузки шаблонов имен файлов: {e}")
+    
+    def update_processing_settings(self):
+        """Число процессов и потоков обхода из полей ввода (неверное значение
+        в поле не меняет настройку)"""
+        try:
+            self.settings['workers'] = max(0, self.workers_var.get())
+            self.settings['scan_threads'] = max(1, self.scan_threads_var.get())
+        except tk.TclError:
+            pass  # Поле редактируется - пока не число
     
     def save_settings(self):
         """Сохранение настроек в файл"""
@@ -536,8 +684,14 @@ class DateStampGUI:
             'position': self.position_var.get(),
             'margin_x': str(self.margin_x_var.get()),
             'margin_y': str(self.margin_y_var.get()),
-            'window_geometry': self.settings['window_geometry']
+            'window_geometry': self.settings['window_geometry'],
+            'scan_threads': str(self.settings['scan_threads']),
+            'workers': str(self.settings['workers'])
         }
+        custom_patterns = get_custom_filename_patterns()
+        if custom_patterns:
+            # Символ % в значениях ini экранируется удвоением
+            config['FilenamePatterns'] = {name: pattern.replace('%', '%%') for name, pattern in custom_patterns}
         
         # Создаем директорию если не существует
         os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
@@ -557,6 +711,8 @@ class DateStampGUI:
         self.position_var.set(self.settings['position'])
         self.margin_x_var.set(self.settings['margin_x'])
         self.margin_y_var.set(self.settings['margin_y'])
+        self.workers_var.set(self.settings['workers'])
+        self.scan_threads_var.set(self.settings['scan_threads'])
         self.update_font_size_label(self.settings['font_size'])
         
         # Включаем режим "поверх всех окон" на 3 секунды при запуске
@@ -584,8 +740,7 @@ class DateStampGUI:
         
         # Инициализируем процесс
         self.is_processing = True
-        self.is_paused = False
-        self.should_cancel = False
+        self.control = ProcessingControl()
         self.processed_count = 0
         
         # Активируем кнопки управления
@@ -595,124 +750,180 @@ class DateStampGUI:
         # Переключаемся на вкладку лога
         self.notebook.select(1)
         
+        # Параметры читаются здесь: поток обработки не обращается к виджетам
+        stamp_options = dict(font_size=self.font_size_var.get(), font_name=self.font_name_var.get(),
+                             position=self.position_var.get(), margin_x=self.margin_x_var.get(),
+                             margin_y=self.margin_y_var.get(), jpeg_quality=95)
+        
         # Запускаем обработку в отдельном потоке
         import threading
-        self.processing_thread = threading.Thread(target=self._process_images_thread)
+        self.processing_thread = threading.Thread(
+            target=self._process_images_thread,
+            args=(self.control, self.input_var.get(), self.output_var.get(), stamp_options))
         self.processing_thread.daemon = True
         self.processing_thread.start()
     
-    def _process_images_thread(self):
-        """Поток обработки изображений"""
+    def _process_images_thread(self, control, input_folder, output_folder, stamp_options):
+        """Поток обработки изображений: раздача файлов пулу процессов.
+        
+        control - ProcessingControl запуска. Поток не опрашивает флаги: он
+        спит, пока не завершится файл в работе, а на паузе без файлов в
+        работе - пока паузу не снимут или не отменят обработку. К виджетам
+        поток не обращается: лог, прогресс и завершение передаются
+        интерфейсу через очередь (post_ui).
+        """
         try:
             self.log_message("Начало обработки изображений")
-            self.status_var.set("Обработка изображений...")
-            
-            # Получаем список всех изображений
-            image_files = self._get_image_files(self.input_var.get())
-            total_files = len(image_files)
+            self.post_ui('status', "Обработка изображений...")
+            
+            # Изображения берутся в работу по мере обхода папок; для прогресса
+            # используется количество, подсчитанное при выборе папки
+            workers = resolve_workers(self.settings['workers'])
+            jobs = self._iter_image_jobs(input_folder, output_folder)
+            self.log_message(f"Параллельная обработка: {workers} процессов")
+            
+            # Слоты обработчиков: в работе не больше файлов, чем процессов, поэтому
+            # слот - это конкретный занятый процесс; значение - имя его файла
+            self.worker_states = [None] * workers
+            in_flight = {}
+            done_count = 0
+            skipped_count = 0
+            exhausted = False
+            started = time.monotonic()
+            paused_time = 0.0
+            last_post = 0.0
             
-            if total_files == 0:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_process,
+                                     initargs=(get_custom_filename_patterns(),)) as executor:
+                try:
+                    while True:
+                        # Новые файлы раздаются только без паузы и отмены;
+                        # файлы, уже отданные процессам, дорабатываются
+                        while (not exhausted and not control.paused and not control.cancelled
+                               and len(in_flight) < workers):
+                            job = next(jobs, None)
+                            if job is None:
+                                exhausted = True
+                                break
+                            slot = self.worker_states.index(None)
+                            self.worker_states[slot] = os.path.basename(job.source_path)
+                            future = executor.submit(run_stamp_job, job, stamp_options, resolve_image_datetime)
+                            in_flight[future] = slot
+                        
+                        if not in_flight:
+                            if exhausted or control.cancelled:
+                                break
+                            # Пауза: ждем продолжения или отмены без нагрузки на CPU
+                            pause_started = time.monotonic()
+                            self._post_progress(done_count, started, paused_time, control)
+                            control.wait_while_paused()
+                            paused_time += time.monotonic() - pause_started
+                            continue
+                        
+                        # Пауза и отмена влияют только на раздачу новых файлов,
+                        # поэтому ждем завершения любого из файлов в работе
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.worker_states[in_flight.pop(future)] = None
+                            done_count += 1
+                            if not self._report_result(future, done_count):
+                                skipped_count += 1
+                        # Прогресс - не чаще PROGRESS_POST_INTERVAL
+                        if time.monotonic() - last_post >= PROGRESS_POST_INTERVAL:
+                            last_post = time.monotonic()
+                            self._post_progress(done_count, started, paused_time, control)
+                finally:
+                    jobs.close()
+            self.worker_states = []
+            
+            if done_count == 0 and not control.cancelled:
                 self.log_message("Изображения не найдены")
-                self._finish_processing(0, "Изображения не найдены")
+                self.post_ui('finish', 0, "Изображения не найдены")
                 return
             
-            self.log_message(f"Найдено {total_files} изображений для обработки")
-            
-            # Обрабатываем каждое изображение
-            skipped_count = 0
-            for i, image_path in enumerate(image_files):
-                # Проверяем флаги управления
-                while self.is_paused and not self.should_cancel:
-                    self.root.after(100, lambda: None)  # Небольшая пауза
-                
-                if self.should_cancel:
-                    self.log_message("Обработка отменена пользователем")
-                    break
-                
-                try:
-                    # Обрабатываем изображение
-                    success = self._process_single_image(image_path)
-                    
-                    if success:
-                        self.processed_count += 1
-                        filename = os.path.basename(image_path)
-                        self.log_message(f"Обработано: {filename} ({self.processed_count}/{total_files})")
-                    else:
-                        skipped_count += 1
-                    
-                    # Обновляем прогресс
-                    progress = ((i + 1) / total_files) * 100
-                    self.progress_var.set(progress)
-                    
-                except Exception as e:
-                    filename = os.path.basename(image_path)
-                    self.log_message(f"Ошибка обработки {filename}: {str(e)}")
-                    skipped_count += 1
-            
             # Завершаем обработку
-            if self.should_cancel:
-                self.log_message("Обработка отменена")
-                self._finish_processing(self.processed_count, "Обработка отменена")
+            if control.cancelled:
+                self.log_message("Обработка отменена пользователем")
+                self.post_ui('finish', self.processed_count, "Обработка отменена")
             else:
-                self.log_message(f"Обработка завершена. Обработано: {self.processed_count}, пропущено: {skipped_count} из {total_files}")
-                self._finish_processing(self.processed_count, f"Обработано {self.processed_count}, пропущено {skipped_count}")
+                elapsed = max(time.monotonic() - started - paused_time, 1e-6)
+                self.log_message(f"Обработка завершена. Обработано: {self.processed_count}, "
+                                 f"пропущено: {skipped_count} из {done_count} "
+                                 f"({done_count / elapsed:.1f} изобр./с)")
+                self.post_ui('finish', self.processed_count, f"Обработано {self.processed_count}, пропущено {skipped_count}")
                 
         except Exception as e:
             self.log_message(f"Критическая ошибка: {str(e)}")
-            self._finish_processing(0, f"Ошибка: {str(e)}")
-    
-    def _get_image_files(self, folder_path):
-        """Получение списка всех изображений в папке"""
-        image_files = []
-        image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif'}
-        
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                if os.path.splitext(file.lower())[1] in image_extensions:
-                    image_files.append(os.path.join(root, file))
-        
-        return image_files
+            self.post_ui('finish', 0, f"Ошибка: {str(e)}")
     
-    def _process_single_image(self, image_path):
-        """Обработка одного изображения"""
-        from DateStamp import add_datetime_watermark, get_datetime_from_exif, get_datetime_from_filename
-        
-        # Получаем дату и время из EXIF или имени файла
-        datetime_obj = get_datetime_from_exif(image_path)
-        if datetime_obj is None:
-            datetime_obj = get_datetime_from_filename(os.path.basename(image_path))
-        
-        # Если не удалось получить дату/время, пропускаем изображение
-        if datetime_obj is None:
-            filename = os.path.basename(image_path)
-            self.log_message(f"ПРОПУЩЕНО: {filename} - не удалось определить дату/время")
+    def _report_result(self, future, done_count):
+        """Запись результата файла в лог; False - файл пропущен или с ошибкой"""
+        total_files = max(self.total_count, done_count)
+        try:
+            result = future.result()
+        except Exception as e:
+            # Сбой процесса пула (например, нехватка памяти)
+            self.log_message(f"Ошибка обработки: {e}", StampLog.LOG_ERROR)
             return False
-        
-        # Определяем относительный путь для сохранения структуры
-        rel_path = os.path.relpath(image_path, self.input_var.get())
-        output_path = os.path.join(self.output_var.get(), rel_path)
-        
-        # Создаем папку назначения если не существует
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Добавляем водяной знак
-        add_datetime_watermark(
-            input_path=image_path,
-            output_path=output_path,
-            datetime_obj=datetime_obj,
-            font_size=self.font_size_var.get(),
-            font_name=self.font_name_var.get(),
-            position=self.position_var.get(),
-            margin_x=self.margin_x_var.get(),
-            margin_y=self.margin_y_var.get()
-        )
-        return True
+        filename = os.path.basename(result.job.source_path)
+        if result.success:
+            self.processed_count += 1
+            self.log_message(f"Обработано: {filename} ({self.processed_count}/{total_files})",
+                             StampLog.LOG_PROCESSED)
+            return True
+        if result.error is not None:
+            self.log_message(f"Ошибка обработки {filename}: {str(result.error)}", StampLog.LOG_ERROR)
+        else:
+            # Если не удалось получить дату/время, изображение пропущено
+            self.log_message(f"ПРОПУЩЕНО: {filename} - не удалось определить дату/время",
+                             StampLog.LOG_SKIPPED)
+        return False
+    
+    def _post_progress(self, done_count, started, paused_time, control):
+        """Отправка прогресса интерфейсу: скорость по времени без пауз"""
+        elapsed = time.monotonic() - started - paused_time
+        rate = done_count / elapsed if elapsed > 0 else 0.0
+        self.post_ui('progress', done_count, max(self.total_count, done_count), rate,
+                     tuple(self.worker_states), control.paused)
+    
+    def _show_progress(self, done_count, total_files, rate, worker_states, paused):
+        """Прогресс и строка состояния: скорость, оставшееся время, обработчики"""
+        self.progress_var.set(done_count / total_files * 100 if total_files else 0)
+        parts = [f"{done_count}/{total_files}", f"{rate:.1f} изобр./с"]
+        if rate > 0 and total_files > done_count:
+            parts.append(f"осталось ~{format_duration((total_files - done_count) / rate)}")
+        
+        if paused:
+            workers_state = "пауза"
+        else:
+            workers_state = ", ".join(
+                f"{slot + 1}: {name[:STATUS_NAME_LENGTH] if name else 'ожидание'}"
+                for slot, name in enumerate(worker_states))
+        self.status_var.set(" · ".join(parts) + f" · обработчики: {workers_state}")
+    
+    def _get_image_files(self, folder_path, exclude=()):
+        """Генератор путей изображений в папке (без построения списка);
+        exclude - папки, не входящие в обход"""
+        # scan_threads > 1 - параллельный обход сетевых папок
+        for scanned in ImageScanner.iter_images(folder_path, GUI_IMAGE_EXTENSIONS,
+                                                exclude=exclude,
+                                                threads=self.settings['scan_threads']):
+            yield scanned.path
+    
+    def _iter_image_jobs(self, input_folder, output_folder):
+        """Задания конвейера: изображения исходной папки с путями в папке результатов"""
+        for image_path in self._get_image_files(input_folder, exclude=(output_folder,)):
+            # Определяем относительный путь для сохранения структуры
+            rel_path = os.path.relpath(image_path, input_folder)
+            output_path = os.path.join(output_folder, rel_path)
+            
+            # Создаем папку назначения если не существует
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            yield StampJob(image_path, output_path, None)
     
     def _finish_processing(self, processed_count, message):
         """Завершение обработки"""
         self.is_processing = False
-        self.is_paused = False
-        self.should_cancel = False
         
         # Деактивируем кнопки управления
         self.pause_button.config(state=tk.DISABLED, text="Пауза")
@@ -733,30 +944,17 @@ class DateStampGUI:
             print(f"Ошибка фильтрации лога: {e}")
     
     def _apply_filter(self):
-        """Применение фильтра к логу"""
+        """Применение фильтра к логу.
+        
+        Записи выбранного типа берутся из индекса буфера и выводятся пачками:
+        первая - сразу, остальные - при разборе очереди интерфейса (_poll_ui).
+        """
         try:
-            filter_type = self.log_filter_var.get()
-            
-            # Получаем строки из оригинального текста
-            lines = self.original_log_text.split('\n')
-            
-            # Фильтруем строки
-            if filter_type == "Все":
-                filtered_lines = lines
-            elif filter_type == "Обработано":
-                filtered_lines = [line for line in lines if "Обработано:" in line]
-            elif filter_type == "Пропущено":
-                filtered_lines = [line for line in lines if "ПРОПУЩЕНО:" in line]
-            elif filter_type == "Ошибки":
-                filtered_lines = [line for line in lines if "Ошибка" in line or "ошибка" in line]
-            else:
-                filtered_lines = lines
-            
-            # Очищаем и заполняем отфильтрованным текстом
+            kind = LOG_FILTERS.get(self.log_filter_var.get())
             self.log_text.delete("1.0", tk.END)
-            filtered_text = '\n'.join(filtered_lines)
-            self.log_text.insert("1.0", filtered_text)
-            
+            self.log_view.clear()
+            self.log_pending = deque(self.log_buffer.get_entries(kind))
+            self._render_log_entries()
         except Exception as e:
             print(f"Ошибка применения фильтра: {e}")
     
@@ -764,7 +962,9 @@ class DateStampGUI:
         """Очистка лога"""
         try:
             self.log_text.delete("1.0", tk.END)
-            self.original_log_text = ""
+            self.log_buffer.clear()
+            self.log_pending.clear()
+            self.log_view.clear()
             self.log_message("Лог очищен")
         except Exception as e:
             print(f"Ошибка очистки лога: {e}")
@@ -773,6 +973,8 @@ class DateStampGUI:
         """Обработчик закрытия окна"""
         # Сохраняем настройки перед закрытием
         self.save_settings()
+        # Останавливаем раздачу файлов: файлы в работе дописываются до выхода
+        self.control.cancel()
         self.root.destroy()
 
 def main():
@@ -790,4 +992,7 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    # Поддержка пула процессов в собранном PyInstaller приложении
+    from multiprocessing import freeze_support
+    freeze_support()
     main()
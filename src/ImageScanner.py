@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FSA-DateStamp - Потоковый обход папок с изображениями
+
+Обход построен на os.scandir: тип записи берется из результата чтения
+каталога без лишних системных вызовов, имена отбираются по расширению до
+любых обращений к файлу, а найденные файлы выдаются генератором сразу -
+обработка начинается, не дожидаясь окончания обхода большого дерева.
+Для сетевых папок, где каждое чтение каталога - долгий запрос, есть
+параллельный обход (scan_images_parallel).
+"""
+
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
+
+# Параллельный обход: число потоков по умолчанию, размер пачки файлов и
+# число пачек в очереди между обходом и обработкой
+SCAN_THREADS = 8
+SCAN_BATCH_SIZE = 64
+SCAN_QUEUE_SIZE = 64
+
+# Найденный файл: полный путь, папка относительно корня обхода ('.' - сам
+# корень), имя файла и результат stat (None, если не запрашивался или
+# недоступен). stat берется из DirEntry и переиспользуется при сохранении
+# метаданных результата.
+ScannedFile = namedtuple('ScannedFile', 'path rel_dir name stat')
+
+def _normalize_excluded(exclude):
+    """Множество исключаемых папок в виде, пригодном для сравнения путей"""
+    return {os.path.normcase(os.path.abspath(path)) for path in exclude if path}
+
+def _scan_folder(folder, rel_dir, extensions, with_stat, excluded, subfolders):
+    """Изображения одной папки; вложенные папки добавляются в subfolders
+    (None - не собирать). Ошибка чтения самой папки - OSError."""
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if subfolders is not None and not (excluded and
+                            os.path.normcase(os.path.abspath(entry.path)) in excluded):
+                        subfolders.append(entry.name)
+                    continue
+                # Сначала дешевая проверка имени, потом тип файла
+                if not entry.name.lower().endswith(extensions) or not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            stat_info = None
+            if with_stat:
+                try:
+                    stat_info = entry.stat()
+                except OSError:
+                    pass  # Ошибку доступа сообщит обработка файла
+            yield ScannedFile(entry.path, rel_dir, entry.name, stat_info)
+
+def shutdown_executor(executor, futures=()):
+    """Остановка пула: задачи futures, еще не начатые, отменяются, начатые
+    дорабатывают до конца (аналог shutdown(cancel_futures=True) из Python 3.9)"""
+    for future in list(futures):
+        future.cancel()
+    executor.shutdown(wait=True)
+
+def _child_rel_dir(rel_dir, name):
+    return name if rel_dir == '.' else os.path.join(rel_dir, name)
+
+def scan_images(root, extensions=IMAGE_EXTENSIONS, recursive=True, with_stat=False, onerror=None,
+                exclude=()):
+    """Генератор изображений в папке root (порядок как у os.walk).
+
+    extensions - кортеж расширений в нижнем регистре. Символические ссылки на
+    папки не обходятся, ошибки чтения папок пропускаются (или передаются в
+    onerror, как у os.walk). exclude - папки, в которые не заходить: обход
+    идет одновременно с записью, и папка результатов внутри исходной не
+    должна попасть в обработку.
+    """
+    excluded = _normalize_excluded(exclude)
+    pending = [(root, '.')]
+    while pending:
+        folder, rel_dir = pending.pop()
+        subfolders = [] if recursive else None
+        try:
+            yield from _scan_folder(folder, rel_dir, extensions, with_stat, excluded, subfolders)
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            continue
+
+        # Вложенные папки - в порядке чтения каталога
+        for name in reversed(subfolders or ()):
+            pending.append((os.path.join(folder, name), _child_rel_dir(rel_dir, name)))
+
+def scan_images_parallel(root, extensions=IMAGE_EXTENSIONS, with_stat=False, onerror=None,
+                         exclude=(), threads=SCAN_THREADS, max_queued=SCAN_QUEUE_SIZE):
+    """Параллельный обход дерева для сетевых папок (SMB/NFS).
+
+    Папки читаются пулом из threads потоков, найденные файлы пачками
+    передаются через очередь из max_queued пачек: если обработка не успевает,
+    обход приостанавливается. Порядок файлов не совпадает с os.walk.
+    Параметры - как у scan_images.
+    """
+    excluded = _normalize_excluded(exclude)
+    results = queue.Queue(max_queued)
+    stop = threading.Event()
+    lock = threading.Lock()
+    active = 0
+    futures = set()
+    executor = ThreadPoolExecutor(max_workers=max(1, threads))
+
+    def put(item):
+        # Ожидание места в очереди, пока потребитель не прекратил обход
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def submit(folder, rel_dir):
+        nonlocal active
+        with lock:
+            active += 1
+        try:
+            future = executor.submit(scan, folder, rel_dir)
+        except RuntimeError:
+            # Пул уже остановлен - обход прерван потребителем
+            with lock:
+                active -= 1
+            return
+        with lock:
+            futures.add(future)
+        future.add_done_callback(forget)
+
+    def forget(future):
+        with lock:
+            futures.discard(future)
+
+    def scan(folder, rel_dir):
+        nonlocal active
+        try:
+            if stop.is_set():
+                return
+            subfolders = []
+            batch = []
+            try:
+                for scanned in _scan_folder(folder, rel_dir, extensions, with_stat, excluded, subfolders):
+                    batch.append(scanned)
+                    if len(batch) >= SCAN_BATCH_SIZE:
+                        put(batch)
+                        batch = []
+            except Exception as e:
+                put(e)
+            if batch:
+                put(batch)
+            # Вложенные папки ставятся в очередь до уменьшения счетчика,
+            # чтобы он не обнулился раньше времени
+            for name in subfolders:
+                submit(os.path.join(folder, name), _child_rel_dir(rel_dir, name))
+        finally:
+            with lock:
+                active -= 1
+                finished = active == 0
+            if finished:
+                put(None)
+
+    submit(root, '.')
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            if isinstance(item, OSError):
+                if onerror is not None:
+                    onerror(item)
+                continue
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+    finally:
+        stop.set()
+        with lock:
+            queued = list(futures)
+        shutdown_executor(executor, queued)
+
+def iter_images(root, extensions=IMAGE_EXTENSIONS, with_stat=False, onerror=None, exclude=(),
+                threads=1):
+    """Обход дерева: последовательный (threads <= 1) или параллельный"""
+    if threads and threads > 1:
+        return scan_images_parallel(root, extensions, with_stat=with_stat, onerror=onerror,
+                                    exclude=exclude, threads=threads)
+    return scan_images(root, extensions, with_stat=with_stat, onerror=onerror, exclude=exclude)
+
+def count_images(root, extensions=IMAGE_EXTENSIONS, threads=1):
+    """Подсчет изображений в дереве папок без построения списка"""
+    return sum(1 for _ in iter_images(root, extensions, threads=threads))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FSA-DateStamp - Поиск одинаковых исходных кадров перед нанесением штампа
+
+Экспорты с камер наблюдения часто содержат один и тот же кадр в нескольких
+папках. Файлы сравниваются по содержимому: хэш считается только для файлов,
+размер которых уже встречался, а первый файл каждого размера хэшируется
+лениво - когда появляется второй кандидат.
+"""
+
+import os
+import shutil
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_file(path):
+    """Потоковый хэш содержимого файла (BLAKE2b)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+class DuplicateIndex:
+    """Индекс исходных файлов по (размер, хэш содержимого, доп. ключ).
+
+    extra_key(path) - дополнительная часть ключа, вычисляется только для
+    файлов с совпавшим содержимым (например, дата, которая попадет в штамп:
+    одинаковые кадры с разными именами могут получить разные даты).
+    """
+
+    def __init__(self, extra_key=None):
+        self._extra_key = extra_key
+        self._unhashed = {}     # размер -> пути, еще не хэшированные
+        self._originals = {}    # (размер, хэш, доп. ключ) -> путь оригинала
+        self.hashed_files = 0
+        self.hashed_bytes = 0
+
+    def _key(self, path, size):
+        digest = hash_file(path)
+        self.hashed_files += 1
+        self.hashed_bytes += size
+        extra = self._extra_key(path) if self._extra_key else None
+        return size, digest, extra
+
+    def find_original(self, path, size):
+        """Путь ранее встреченного файла с тем же содержимым или None.
+
+        Если оригинала нет, файл сам регистрируется как оригинал.
+        """
+        unhashed = self._unhashed.get(size)
+        if unhashed is None:
+            # Первый файл такого размера - дубликатом быть не может
+            self._unhashed[size] = [path]
+            return None
+
+        for other in unhashed:
+            self._originals.setdefault(self._key(other, size), other)
+        unhashed.clear()
+
+        original = self._originals.setdefault(self._key(path, size), path)
+        return original if original != path else None
+
+def link_or_copy(source_path, dest_path, hardlink=True):
+    """Размещение готового результата по второму пути.
+
+    Жесткая ссылка, если возможно (та же файловая система), иначе копия.
+    Возвращает True, если создана жесткая ссылка. Запись результатов идет
+    через замену файла (DateStamp.replace_output_file), поэтому повторная
+    обработка одного из связанных путей не меняет остальные.
+    """
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    if hardlink:
+        try:
+            os.link(source_path, dest_path)
+            return True
+        except OSError:
+            pass  # Другая файловая система или ссылки не поддерживаются
+    shutil.copyfile(source_path, dest_path)
+    return False
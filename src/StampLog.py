@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FSA-DateStamp - Буфер лога обработки для графического интерфейса
+
+Записи добавляются в потоке интерфейса (append): сообщения других потоков
+приходят через очередь сообщений интерфейса (DateStampGUI.post_ui) и
+переносятся в буфер пачками по таймеру. Хранится не больше capacity
+последних записей (кольцевой буфер): память и размер окна лога не растут на
+длинных прогонах.
+
+Для фильтра окна лога буфер ведет индексы по типам записей: они
+пополняются вместе с буфером и теряют вытесненные записи, поэтому выборка
+одного типа не перебирает остальные записи.
+"""
+
+from collections import deque, namedtuple
+from datetime import datetime
+
+# Типы записей лога (для фильтра в окне лога)
+LOG_INFO = 'info'
+LOG_PROCESSED = 'processed'
+LOG_SKIPPED = 'skipped'
+LOG_ERROR = 'error'
+LOG_KINDS = (LOG_INFO, LOG_PROCESSED, LOG_SKIPPED, LOG_ERROR)
+
+# Записей в буфере по умолчанию
+LOG_CAPACITY = 5000
+
+# Запись лога: порядковый номер (растет на всем прогоне), время, тип, текст
+LogEntry = namedtuple('LogEntry', 'seq timestamp kind text')
+
+def classify_message(text):
+    """Тип записи по тексту сообщения (правила прежнего фильтра лога)"""
+    if "Обработано:" in text:
+        return LOG_PROCESSED
+    if "ПРОПУЩЕНО:" in text:
+        return LOG_SKIPPED
+    if "Ошибка" in text or "ошибка" in text:
+        return LOG_ERROR
+    return LOG_INFO
+
+def format_entry(entry):
+    """Строка записи для окна лога (без перевода строки)"""
+    return f"[{entry.timestamp.strftime('%H:%M:%S')}] {entry.text}"
+
+class LogBuffer:
+    """Кольцевой буфер записей лога с индексами по типам записей"""
+
+    def __init__(self, capacity=LOG_CAPACITY):
+        self.capacity = capacity
+        self.entries = deque(maxlen=capacity)
+        # Индексы по типам: записи каждого типа в порядке поступления
+        self.by_kind = {kind: deque() for kind in LOG_KINDS}
+        self._next_seq = 0
+
+    def append(self, text, kind=None, timestamp=None):
+        """Добавление записи; kind - тип записи (по умолчанию - по тексту),
+        timestamp - время сообщения (по умолчанию - текущее). Возвращает LogEntry."""
+        entry = LogEntry(self._next_seq, timestamp or datetime.now(), kind or classify_message(text), text)
+        self._next_seq += 1
+        if len(self.entries) == self.capacity:
+            # Вытесняемая запись - самая старая и в индексе своего типа
+            evicted = self.entries[0]
+            self.by_kind[evicted.kind].popleft()
+        self.entries.append(entry)
+        self.by_kind.setdefault(entry.kind, deque()).append(entry)
+        return entry
+
+    def get_entries(self, kind=None):
+        """Записи буфера одного типа (None - все) в порядке поступления"""
+        if kind is None:
+            return self.entries
+        return self.by_kind.get(kind, ())
+
+    @property
+    def first_seq(self):
+        """Номер самой старой записи в буфере"""
+        return self.entries[0].seq if self.entries else self._next_seq
+
+    def clear(self):
+        """Очистка буфера"""
+        self.entries.clear()
+        for entries in self.by_kind.values():
+            entries.clear()
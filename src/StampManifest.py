@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FSA-DateStamp - Манифест обработанных файлов для инкрементального режима
+
+Манифест - база SQLite в корне папки назначения. Для каждого исходного файла
+хранятся размер, время изменения и ключ параметров штампа, с которыми он был
+обработан. При повторном запуске файл пропускается, если эти значения
+совпадают с текущими (достаточно одного stat), а результат на месте.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+MANIFEST_FILENAME = '.datestamp_manifest.sqlite3'
+# Фиксация изменений пачками: прерванный запуск не теряет уже сделанную работу
+MANIFEST_COMMIT_EVERY = 200
+# Версия формата штампа: увеличивается при изменении отрисовки, чтобы
+# старые записи манифеста перестали считаться актуальными
+STAMP_RENDER_VERSION = 1
+# Проверки идут из потока обхода (конвейер), записи - из основного потока
+_manifest_lock = threading.Lock()
+
+def get_manifest_path(dest_root):
+    """Путь к файлу манифеста в папке назначения"""
+    return os.path.join(dest_root, MANIFEST_FILENAME)
+
+def get_settings_key(**settings):
+    """Ключ параметров штампа: хэш от отсортированного набора настроек"""
+    settings['render_version'] = STAMP_RENDER_VERSION
+    payload = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def get_manifest_key(source_root, source_path):
+    """Ключ файла в манифесте - путь относительно исходной папки с '/'"""
+    return os.path.relpath(source_path, source_root).replace(os.sep, '/')
+
+def open_manifest(dest_root, rebuild=False):
+    """Открытие (создание) манифеста; rebuild - очистить все записи"""
+    conn = sqlite3.connect(get_manifest_path(dest_root), check_same_thread=False)
+    conn.execute('''CREATE TABLE IF NOT EXISTS processed (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        settings TEXT NOT NULL,
+                        processed_at REAL NOT NULL)''')
+    if rebuild:
+        conn.execute('DELETE FROM processed')
+    conn.commit()
+    return conn
+
+def is_unchanged(conn, key, stat_info, settings_key):
+    """Проверка: файл уже обработан с теми же размером, mtime и параметрами"""
+    with _manifest_lock:
+        row = conn.execute('SELECT size, mtime_ns, settings FROM processed WHERE path = ?',
+                           (key,)).fetchone()
+    return row is not None and row == (stat_info.st_size, stat_info.st_mtime_ns, settings_key)
+
+def record_processed(conn, key, stat_info, settings_key):
+    """Запись об успешно обработанном файле (фиксируется пачками)"""
+    with _manifest_lock:
+        conn.execute('INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?)',
+                     (key, stat_info.st_size, stat_info.st_mtime_ns, settings_key, time.time()))
+        if conn.total_changes % MANIFEST_COMMIT_EVERY == 0:
+            conn.commit()
+
+def close_manifest(conn):
+    """Фиксация оставшихся записей и закрытие манифеста"""
+    with _manifest_lock:
+        conn.commit()
+        conn.close()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FSA-DateStamp - Замеры времени по стадиям обработки
+
+Легковесная инструментовка: таймеры стадий (контекстный менеджер stage),
+счетчики и гистограммы длительностей. По умолчанию выключена - stage()
+возвращает общий пустой контекстный менеджер, и замеры почти ничего не
+стоят. Включается enable_metrics(); сводку по стадиям печатает
+process_images_with_structure (см. format_report), а обработчики,
+добавленные add_metrics_hook, получают каждое измерение - например, для
+передачи в собственную систему сбора метрик:
+
+    StampMetrics.add_metrics_hook(lambda kind, name, value: collector.send(name, value))
+    StampMetrics.enable_metrics()
+
+Процессы пула не ведут сводку сами: измерения копятся (enable_metrics(
+forward=True)), возвращаются вместе с результатом задачи
+(drain_observations) и добавляются в сводку основного процесса
+(merge_observations). Поэтому обработчики вызываются только в основном
+процессе.
+
+Стадии могут быть вложены: первая загрузка шрифта (font_load) и построение
+атласа глифов (glyph_atlas) входят и в стадию draw.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# Верхние границы корзин гистограммы длительностей, мс (последняя корзина - больше)
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_enabled = False
+# Процесс пула: измерения не агрегируются, а ждут передачи основному процессу
+_forward = False
+_pending = []
+# Стадия -> [число замеров, суммарное время, максимум, корзины гистограммы]
+_timers = {}
+_counters = {}
+_hooks = []
+# Замеры идут и из потоков конвейера
+_lock = threading.Lock()
+_disabled_stage = nullcontext()
+
+def enable_metrics(forward=False):
+    """Включение замеров; forward=True - режим процесса пула (см. drain_observations)"""
+    global _enabled, _forward
+    _enabled = True
+    _forward = forward
+
+def disable_metrics():
+    global _enabled
+    _enabled = False
+
+def metrics_enabled():
+    return _enabled
+
+def reset_metrics():
+    """Очистка накопленной сводки (обработчики сохраняются)"""
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _pending.clear()
+
+def add_metrics_hook(hook):
+    """Добавление обработчика измерений hook(kind, name, value).
+
+    kind - 'timer' (value - длительность в секундах) или 'counter' (value -
+    приращение). Обработчик вызывается в потоке, сделавшем замер, поэтому
+    должен быть быстрым и потокобезопасным.
+    """
+    _hooks.append(hook)
+
+def remove_metrics_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+def stage(name):
+    """Контекстный менеджер замера стадии: with StampMetrics.stage('encode'): ..."""
+    if not _enabled:
+        return _disabled_stage
+    return _timed_stage(name)
+
+@contextmanager
+def _timed_stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record('timer', name, time.perf_counter() - started)
+
+def timed_iter(name, iterable):
+    """Перебор iterable с замером времени получения каждого элемента
+    (например, обхода папок, совмещенного с обработкой)"""
+    if not _enabled:
+        return iterable
+    return _timed_iter(name, iter(iterable))
+
+def _timed_iter(name, iterator):
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            _record('timer', name, time.perf_counter() - started)
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            iterator.close()
+
+def record_time(name, seconds):
+    """Замер стадии, измеренной вызывающей стороной"""
+    if _enabled:
+        _record('timer', name, seconds)
+
+def count(name, value=1):
+    """Увеличение счетчика"""
+    if _enabled:
+        _record('counter', name, value)
+
+def _record(kind, name, value):
+    with _lock:
+        if _forward:
+            _pending.append((kind, name, value))
+            return
+        if kind == 'timer':
+            entry = _timers.get(name)
+            if entry is None:
+                entry = _timers[name] = [0, 0.0, 0.0, [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)]
+            entry[0] += 1
+            entry[1] += value
+            entry[2] = max(entry[2], value)
+            entry[3][bisect_left(HISTOGRAM_BOUNDS_MS, value * 1000)] += 1
+        else:
+            _counters[name] = _counters.get(name, 0) + value
+    for hook in list(_hooks):
+        try:
+            hook(kind, name, value)
+        except Exception as e:
+            print(f"Предупреждение: обработчик метрик завершился с ошибкой: {e}")
+
+def drain_observations():
+    """Измерения процесса пула с прошлого вызова: [(kind, name, value)]"""
+    with _lock:
+        observations = list(_pending)
+        _pending.clear()
+    return observations
+
+def merge_observations(observations):
+    """Добавление в сводку измерений из процесса пула"""
+    if _enabled:
+        for kind, name, value in observations:
+            _record(kind, name, value)
+
+def _percentile_ms(buckets, total_count, maximum, fraction):
+    """Оценка перцентиля по гистограмме: верхняя граница корзины, мс"""
+    threshold = fraction * total_count
+    cumulative = 0
+    for bound, bucket_count in zip(HISTOGRAM_BOUNDS_MS, buckets):
+        cumulative += bucket_count
+        if cumulative >= threshold:
+            return min(bound, maximum * 1000)
+    return maximum * 1000
+
+def get_metrics_snapshot():
+    """Сводка: {'timers': {стадия: {...}}, 'counters': {имя: значение}}"""
+    with _lock:
+        timers = {name: (entry[0], entry[1], entry[2], list(entry[3])) for name, entry in _timers.items()}
+        counters = dict(_counters)
+    snapshot = {'timers': {}, 'counters': counters}
+    for name, (calls, total, maximum, buckets) in timers.items():
+        snapshot['timers'][name] = {
+            'count': calls,
+            'total_sec': total,
+            'mean_ms': total / calls * 1000,
+            'max_ms': maximum * 1000,
+            'p50_ms': _percentile_ms(buckets, calls, maximum, 0.5),
+            'p95_ms': _percentile_ms(buckets, calls, maximum, 0.95),
+            'histogram': dict(zip([f'<={bound}ms' for bound in HISTOGRAM_BOUNDS_MS]
+                                  + [f'>{HISTOGRAM_BOUNDS_MS[-1]}ms'], buckets)),
+        }
+    return snapshot
+
+def format_report():
+    """Строки сводки по стадиям (по убыванию суммарного времени)"""
+    snapshot = get_metrics_snapshot()
+    lines = ["Время по стадиям:"]
+    if not snapshot['timers']:
+        lines.append("  (замеров нет)")
+    else:
+        lines.append(f"  {'стадия':<14} {'вызовов':>8} {'всего, с':>9} {'среднее, мс':>12} "
+                     f"{'p50, мс':>8} {'p95, мс':>8} {'макс, мс':>9}")
+        ordered = sorted(snapshot['timers'].items(), key=lambda item: -item[1]['total_sec'])
+        for name, timer in ordered:
+            lines.append(f"  {name:<14} {timer['count']:>8} {timer['total_sec']:>9.2f} {timer['mean_ms']:>12.2f} "
+                         f"{timer['p50_ms']:>8.1f} {timer['p95_ms']:>8.1f} {timer['max_ms']:>9.1f}")
+    if snapshot['counters']:
+        lines.append("Счетчики: " + ", ".join(f"{name}={value}" for name, value
+                                              in sorted(snapshot['counters'].items())))
+    return lines
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FSA-DateStamp - Конвейер обработки файлов с отдельными стадиями
+
+Чтение файлов, обработка (декодирование, штамп, кодирование) и запись идут
+в разных потоках и связаны ограниченными очередями: пока файл N кодируется,
+файл N+1 уже читается с диска, а готовый N-1 записывается. Pillow
+освобождает GIL на время декодирования и кодирования, поэтому несколько
+потоков обработки загружают несколько ядер. Размер очередей ограничивает
+число файлов в памяти, а бюджет памяти (MemoryBudget) - их суммарный объем.
+"""
+
+import queue
+import threading
+
+_DONE = object()
+# Интервал проверки остановки конвейера при ожидании очереди, с
+_POLL_INTERVAL = 0.1
+
+class MemoryBudget:
+    """Бюджет памяти для допуска файлов в обработку.
+
+    Файл допускается, если его оценка помещается в свободную часть бюджета.
+    Файл больше всего бюджета допускается, только когда в работе ничего нет:
+    он обрабатывается один, но обработка не останавливается.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, cost):
+        return self.used == 0 or self.used + cost <= self.limit
+
+    def _take(self, cost):
+        self.used += cost
+        self.peak = max(self.peak, self.used)
+
+    def try_acquire(self, cost):
+        """Допуск без ожидания: True, если память выделена"""
+        with self._condition:
+            if not self._fits(cost):
+                return False
+            self._take(cost)
+            return True
+
+    def acquire(self, cost, timeout=None):
+        """Ожидание свободной памяти; False - истек timeout"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._fits(cost), timeout):
+                return False
+            self._take(cost)
+            return True
+
+    def release(self, cost):
+        with self._condition:
+            self.used -= cost
+            self._condition.notify_all()
+
+class ProcessingControl:
+    """Пауза и отмена обработки для потока раздачи файлов в пул.
+
+    Пауза и отмена останавливают только выдачу новых файлов: файлы, уже
+    взятые в работу, обрабатываются и записываются до конца. Ожидание
+    снятия паузы не нагружает процессор (threading.Condition).
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._paused = False
+        self._cancelled = False
+
+    @property
+    def paused(self):
+        return self._paused
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def pause(self):
+        with self._condition:
+            self._paused = True
+            self._condition.notify_all()
+
+    def resume(self):
+        with self._condition:
+            self._paused = False
+            self._condition.notify_all()
+
+    def cancel(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    def wait_while_paused(self, timeout=None):
+        """Ожидание снятия паузы или отмены.
+
+        True - можно брать следующий файл, False - отмена (или пауза не
+        снята за timeout секунд).
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._paused or self._cancelled, timeout)
+            return not self._paused and not self._cancelled
+
+def run_pipeline(items, read, process, write, workers=2, queue_size=None, budget=None, cost=None):
+    """Генератор результатов конвейера в порядке входных элементов.
+
+    read(item) -> данные (поток чтения), process(item, данные) -> результат
+    обработки (workers потоков), write(item, результат) -> итог (поток
+    записи). Выдает тройки (item, итог, исключение): ошибка любой стадии
+    не останавливает конвейер, а возвращается для своего элемента.
+    Закрытие генератора останавливает все стадии.
+
+    budget - MemoryBudget, cost(item) - оценка памяти элемента: элемент
+    читается, только когда помещается в бюджет, и освобождает его после записи.
+    """
+    workers = max(1, workers)
+    if queue_size is None:
+        queue_size = workers * 2
+    read_queue = queue.Queue(queue_size)
+    write_queue = queue.Queue(queue_size)
+    done_queue = queue.Queue()
+    stop = threading.Event()
+    items_error = []
+    costs = {}
+
+    def put(target, entry):
+        # Ожидание места в очереди, пока конвейер не остановлен
+        while not stop.is_set():
+            try:
+                target.put(entry, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(source):
+        while not stop.is_set():
+            try:
+                return source.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def reader():
+        iterator = iter(items)
+        try:
+            for index, item in enumerate(iterator):
+                if budget is not None:
+                    item_cost = cost(item)
+                    while not budget.acquire(item_cost, timeout=_POLL_INTERVAL):
+                        if stop.is_set():
+                            return
+                    costs[index] = item_cost
+                try:
+                    payload, error = read(item), None
+                except Exception as e:
+                    payload, error = None, e
+                if not put(read_queue, (index, item, payload, error)):
+                    return
+        except Exception as e:
+            # Ошибка самого источника элементов - передается потребителю
+            items_error.append(e)
+        finally:
+            # Генератор источника закрывается в том же потоке, где выполнялся
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            for _ in range(workers):
+                put(read_queue, _DONE)
+
+    def worker():
+        while True:
+            entry = get(read_queue)
+            if entry is _DONE:
+                break
+            index, item, payload, error = entry
+            if error is None:
+                try:
+                    payload = process(item, payload)
+                except Exception as e:
+                    payload, error = None, e
+            if not put(write_queue, (index, item, payload, error)):
+                return
+        put(write_queue, _DONE)
+
+    def writer():
+        finished = 0
+        while finished < workers:
+            entry = get(write_queue)
+            if entry is _DONE:
+                if stop.is_set():
+                    return
+                finished += 1
+                continue
+            index, item, payload, error = entry
+            result = None
+            if error is None:
+                try:
+                    result = write(item, payload)
+                except Exception as e:
+                    error = e
+            if budget is not None:
+                budget.release(costs.pop(index))
+            done_queue.put((index, item, result, error))
+        done_queue.put(_DONE)
+
+    threads = [threading.Thread(target=reader, daemon=True),
+               threading.Thread(target=writer, daemon=True)]
+    threads += [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        # Результаты приходят в порядке завершения - выдаем по порядку входа
+        ready = {}
+        next_index = 0
+        while True:
+            entry = done_queue.get()
+            if entry is _DONE:
+                break
+            ready[entry[0]] = entry[1:]
+            while next_index in ready:
+                yield ready.pop(next_index)
+                next_index += 1
+        if items_error:
+            raise items_error[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
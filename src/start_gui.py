@@ -9,4 +9,7 @@ FSA-DateStamp GUI Launcher
 from DateStampGUI import main
 
 if __name__ == "__main__":
+    # Поддержка пула процессов в собранном PyInstaller приложении
+    from multiprocessing import freeze_support
+    freeze_support()
     main()
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""Общие настройки тестов: модули берутся из src, как в benchmarks"""
+
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+@pytest.fixture
+def make_image():
+    """Создание изображения-заливки: make_image(путь, цвет, размер)"""
+    def make(path, color='red', size=(200, 100)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', size, color).save(path)
+        return path
+    return make
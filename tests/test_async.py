@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Асинхронный интерфейс (DateStampAsync.stamp_tree)"""
+
+import asyncio
+import os
+
+from PIL import Image
+
+import DateStampAsync
+
+def make_tree(root, count):
+    for index in range(count):
+        folder = os.path.join(root, f'cam{index % 2}')
+        os.makedirs(folder, exist_ok=True)
+        Image.new('RGB', (120, 80), 'gray').save(os.path.join(folder, f'IMG_20200101_1010{index:02d}.jpg'))
+
+def test_stamp_tree_mirrors_structure(tmp_path):
+    make_tree(str(tmp_path / 'src'), 6)
+    summary = asyncio.run(DateStampAsync.stamp_tree_summary(str(tmp_path / 'src'), str(tmp_path / 'out'),
+                                                            font_size=12, workers=2))
+    assert summary == (6, 0)
+    assert sorted(os.listdir(tmp_path / 'out' / 'cam0')) == sorted(os.listdir(tmp_path / 'src' / 'cam0'))
+
+def test_stamp_tree_stops_on_aclose(tmp_path):
+    make_tree(str(tmp_path / 'src'), 20)
+
+    async def first_result():
+        results = DateStampAsync.stamp_tree(str(tmp_path / 'src'), str(tmp_path / 'out'),
+                                            font_size=12, workers=1, max_in_flight=1)
+        async for result in results:
+            await results.aclose()
+            return result
+
+    result = asyncio.run(first_result())
+    assert result.success
+    written = sum(len(files) for _, _, files in os.walk(tmp_path / 'out'))
+    assert written < 20
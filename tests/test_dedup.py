@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Дедупликация одинаковых исходных кадров (StampDedup, --dedup)"""
+
+import os
+
+from PIL import Image
+
+import StampDedup
+from DateStamp import process_images_with_structure
+
+NAME = 'IMG_20200101_101010.jpg'
+
+def read_color(path):
+    with Image.open(path) as image:
+        return image.convert('RGB').getpixel((0, 0))
+
+def test_find_original_by_content(tmp_path, make_image):
+    first = make_image(str(tmp_path / 'a' / NAME))
+    second = make_image(str(tmp_path / 'b' / NAME))
+    other = make_image(str(tmp_path / 'c' / NAME), color='blue')
+    index = StampDedup.DuplicateIndex()
+    assert index.find_original(first, os.path.getsize(first)) is None
+    assert index.find_original(second, os.path.getsize(second)) == first
+    assert index.find_original(other, os.path.getsize(other)) is None
+
+def test_duplicates_are_hardlinked(tmp_path, make_image):
+    make_image(str(tmp_path / 'src' / 'x' / NAME))
+    make_image(str(tmp_path / 'src' / 'y' / NAME))
+    dest = tmp_path / 'out'
+    process_images_with_structure(str(tmp_path / 'src'), str(dest), dedup='hardlink')
+    x_stat = os.stat(dest / 'x' / NAME)
+    y_stat = os.stat(dest / 'y' / NAME)
+    assert x_stat.st_ino == y_stat.st_ino
+
+def test_restamp_does_not_write_through_hardlink(tmp_path, make_image):
+    source = make_image(str(tmp_path / 'src' / 'x' / NAME))
+    make_image(str(tmp_path / 'src' / 'y' / NAME))
+    dest = tmp_path / 'out'
+    process_images_with_structure(str(tmp_path / 'src'), str(dest), dedup='hardlink', incremental=True)
+    y_before = (dest / 'y' / NAME).read_bytes()
+
+    # Изменился только x: его результат пересоздается, у y - прежний
+    make_image(source, color='blue')
+    os.utime(source, (1, 1))
+    process_images_with_structure(str(tmp_path / 'src'), str(dest), dedup='hardlink', incremental=True)
+    assert (dest / 'y' / NAME).read_bytes() == y_before
+    assert read_color(dest / 'x' / NAME)[2] > 200
+    assert read_color(dest / 'y' / NAME)[0] > 200
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Дата из имени файла: приоритет шаблонов и память по папкам"""
+
+from datetime import datetime
+
+import pytest
+
+import DateStamp
+from DateStamp import get_datetime_from_filename, register_filename_pattern
+
+SHOT_PATTERN = (r'shot(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})'
+                r'(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})')
+
+@pytest.fixture(autouse=True)
+def clean_registry(monkeypatch):
+    """Пользовательские шаблоны и память папок - свои для каждого теста"""
+    monkeypatch.setattr(DateStamp, '_custom_filename_patterns', [])
+    monkeypatch.setattr(DateStamp, '_filename_pattern_registry', None)
+    DateStamp.reset_filename_pattern_memo()
+    yield
+    DateStamp.reset_filename_pattern_memo()
+
+@pytest.mark.parametrize('filename, expected', [
+    ('IMG_20230101_123456.jpg', datetime(2023, 1, 1, 12, 34, 56)),
+    ('20230101_123456.jpg', datetime(2023, 1, 1, 12, 34, 56)),
+    ('camera13_01-01-2024_22h16m08s163ms.jpg', datetime(2024, 1, 1, 22, 16, 8)),
+    ('camera13_2023-Nov-21_13_36_19_680.jpg', datetime(2023, 11, 21, 13, 36, 19)),
+    ('camera13_2023-Ноябрь-21_13_36_19_680.jpg', datetime(2023, 11, 21, 13, 36, 19)),
+    ('photo.jpg', None),
+])
+def test_builtin_patterns(filename, expected):
+    assert get_datetime_from_filename(filename) == expected
+
+def test_custom_pattern_beats_earlier_builtin_match():
+    register_filename_pattern('shot', SHOT_PATTERN)
+    filename = '01-05-2020_10h10m10s_shot20230101121314.jpg'
+    assert get_datetime_from_filename(filename) == datetime(2023, 1, 1, 12, 13, 14)
+
+def test_invalid_calendar_date_continues_search():
+    filename = '31-02-2024_01h01m01s_then_01-01-2024_22h16m08s.jpg'
+    assert get_datetime_from_filename(filename) == datetime(2024, 1, 1, 22, 16, 8)
+
+def test_unknown_month_name_continues_search():
+    filename = 'camera1_2023-Foo-01_1_1_1_1 camera13_2023-Nov-21_13_36_19_680.jpg'
+    assert get_datetime_from_filename(filename) == datetime(2023, 11, 21, 13, 36, 19)
+
+def test_directory_memo_keeps_priority():
+    register_filename_pattern('shot', SHOT_PATTERN)
+    # Первый файл запоминает для папки встроенный шаблон dmy_hms
+    assert get_datetime_from_filename('01-05-2020_10h10m10s.jpg', 'cam') == datetime(2020, 5, 1, 10, 10, 10)
+    # Во втором есть и пользовательский шаблон - он важнее запомненного
+    filename = '01-05-2020_10h10m10s_shot20230101121314.jpg'
+    assert get_datetime_from_filename(filename, 'cam') == get_datetime_from_filename(filename)
+    assert get_datetime_from_filename(filename, 'cam') == datetime(2023, 1, 1, 12, 13, 14)
+
+def test_directory_memo_hits():
+    for second in range(10):
+        get_datetime_from_filename(f'IMG_20230101_1234{second:02d}.jpg', 'dir')
+    stats = DateStamp.get_filename_pattern_stats()
+    assert stats == {'hits': 9, 'misses': 1}
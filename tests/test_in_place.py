@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Штамп на месте для несжатых BMP/TIFF (get_in_place_layout, stamp_in_place)"""
+
+import os
+from datetime import datetime
+
+import pytest
+from PIL import Image, ImageChops
+
+from DateStamp import add_datetime_watermark, get_in_place_layout, get_stamp_region
+
+STAMP_DATE = datetime(2024, 5, 6, 7, 8, 9)
+STAMP = dict(font_size=20, position='bottom-right', margin_x=5, margin_y=5)
+
+def make_frame(path, mode='RGB', **save_options):
+    """Кадр с градиентом, чтобы ошибка смещения строк была заметна"""
+    gradient = Image.linear_gradient('L').resize((240, 160))
+    bands = (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), gradient.transpose(Image.FLIP_TOP_BOTTOM))
+    image = Image.merge('RGB', bands).convert(mode)
+    image.save(path, **save_options)
+    return path
+
+@pytest.mark.parametrize('name, mode, save_options', [
+    ('frame.bmp', 'RGB', {}),
+    ('frame.tif', 'RGB', {}),
+    ('frame.tif', 'RGBA', {}),
+    ('strips.tif', 'RGB', {'tiffinfo': {278: 16}}),   # RowsPerStrip: несколько полос
+])
+def test_in_place_matches_full_encode(tmp_path, name, mode, save_options):
+    source = make_frame(str(tmp_path / name), mode, **save_options)
+    with Image.open(source) as image:
+        assert get_in_place_layout(image, source) is not None
+
+    patched = str(tmp_path / ('patched_' + name))
+    encoded = str(tmp_path / ('encoded_' + name))
+    add_datetime_watermark(source, patched, STAMP_DATE, in_place=True, **STAMP)
+    add_datetime_watermark(source, encoded, STAMP_DATE, in_place=False, **STAMP)
+    with Image.open(patched) as a, Image.open(encoded) as b:
+        assert a.mode == b.mode and a.size == b.size
+        assert ImageChops.difference(a.convert('RGBA'), b.convert('RGBA')).getbbox() is None
+
+def test_in_place_changes_only_stamp_region(tmp_path):
+    source = make_frame(str(tmp_path / 'frame.bmp'))
+    patched = str(tmp_path / 'patched.bmp')
+    add_datetime_watermark(source, patched, STAMP_DATE, **STAMP)
+    assert os.path.getsize(patched) == os.path.getsize(source)
+    left, top, right, bottom = get_stamp_region(STAMP_DATE, (240, 160), **STAMP)
+    with Image.open(source) as a, Image.open(patched) as b:
+        changed = ImageChops.difference(a, b).getbbox()
+    assert changed is not None
+    assert left <= changed[0] and top <= changed[1] and changed[2] <= right and changed[3] <= bottom
+
+@pytest.mark.parametrize('name, save_options', [
+    ('frame.jpg', {}),
+    ('frame.png', {}),
+    ('lzw.tif', {'compression': 'tiff_lzw'}),
+])
+def test_compressed_formats_are_not_patched(tmp_path, name, save_options):
+    source = make_frame(str(tmp_path / name), **save_options)
+    with Image.open(source) as image:
+        assert get_in_place_layout(image, source) is None
+
+def test_output_extension_must_match(tmp_path):
+    source = make_frame(str(tmp_path / 'frame.bmp'))
+    with Image.open(source) as image:
+        assert get_in_place_layout(image, str(tmp_path / 'frame.png')) is None
+
+def test_overwrite_keeps_other_hardlinks(tmp_path):
+    source = make_frame(str(tmp_path / 'frame.bmp'))
+    linked = str(tmp_path / 'linked.bmp')
+    os.link(source, linked)
+    original = open(linked, 'rb').read()
+    add_datetime_watermark(source, source, STAMP_DATE, **STAMP)
+    assert open(linked, 'rb').read() == original
+    assert open(source, 'rb').read() != original
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Инкрементальный режим: манифест обработанных файлов (StampManifest)"""
+
+import os
+import re
+
+import StampManifest
+from DateStamp import process_images_with_structure
+
+NAME = 'IMG_20200101_101010.jpg'
+
+def run(capsys, source, dest, **options):
+    """Запуск с манифестом: (успешно, пропущено без изменений)"""
+    capsys.readouterr()
+    process_images_with_structure(str(source), str(dest), incremental=True, **options)
+    output = capsys.readouterr().out
+    processed = int(re.search(r'Успешно: (\d+)', output).group(1))
+    skipped = int(re.search(r'Пропущено без изменений: (\d+)', output).group(1))
+    return processed, skipped
+
+def test_record_and_check(tmp_path, make_image):
+    source = make_image(str(tmp_path / NAME))
+    stat_info = os.stat(source)
+    conn = StampManifest.open_manifest(str(tmp_path))
+    key = StampManifest.get_settings_key(font_size=30)
+    StampManifest.record_processed(conn, NAME, stat_info, key)
+    assert StampManifest.is_unchanged(conn, NAME, stat_info, key)
+    assert not StampManifest.is_unchanged(conn, NAME, stat_info, StampManifest.get_settings_key(font_size=40))
+    assert not StampManifest.is_unchanged(conn, 'other.jpg', stat_info, key)
+    StampManifest.close_manifest(conn)
+
+def test_second_run_skips_unchanged(tmp_path, make_image, capsys):
+    make_image(str(tmp_path / 'src' / 'a' / NAME))
+    make_image(str(tmp_path / 'src' / 'b' / NAME))
+    assert run(capsys, tmp_path / 'src', tmp_path / 'out') == (2, 0)
+    assert run(capsys, tmp_path / 'src', tmp_path / 'out') == (0, 2)
+
+def test_changed_source_is_restamped(tmp_path, make_image, capsys):
+    source = make_image(str(tmp_path / 'src' / NAME))
+    run(capsys, tmp_path / 'src', tmp_path / 'out')
+    make_image(source, color='blue', size=(300, 100))
+    assert run(capsys, tmp_path / 'src', tmp_path / 'out') == (1, 0)
+
+def test_touched_source_is_restamped(tmp_path, make_image, capsys):
+    source = make_image(str(tmp_path / 'src' / NAME))
+    run(capsys, tmp_path / 'src', tmp_path / 'out')
+    os.utime(source, ns=(1, 1))
+    assert run(capsys, tmp_path / 'src', tmp_path / 'out') == (1, 0)
+
+def test_changed_settings_restamp(tmp_path, make_image, capsys):
+    make_image(str(tmp_path / 'src' / NAME))
+    run(capsys, tmp_path / 'src', tmp_path / 'out', font_size=30)
+    assert run(capsys, tmp_path / 'src', tmp_path / 'out', font_size=40) == (1, 0)
+
+def test_missing_output_is_restamped(tmp_path, make_image, capsys):
+    make_image(str(tmp_path / 'src' / NAME))
+    run(capsys, tmp_path / 'src', tmp_path / 'out')
+    os.remove(tmp_path / 'out' / NAME)
+    assert run(capsys, tmp_path / 'src', tmp_path / 'out') == (1, 0)
+    assert os.path.exists(tmp_path / 'out' / NAME)
+
+def test_force_rebuild(tmp_path, make_image, capsys):
+    make_image(str(tmp_path / 'src' / NAME))
+    run(capsys, tmp_path / 'src', tmp_path / 'out')
+    assert run(capsys, tmp_path / 'src', tmp_path / 'out', force_rebuild=True) == (1, 0)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Допуск файлов в обработку по бюджету памяти (StampPipeline.MemoryBudget)"""
+
+import threading
+import time
+
+from StampPipeline import MemoryBudget
+
+def test_admits_within_limit():
+    budget = MemoryBudget(100)
+    assert budget.try_acquire(60)
+    assert not budget.try_acquire(50)
+    assert budget.try_acquire(40)
+    assert budget.used == 100 and budget.peak == 100
+
+def test_oversized_item_runs_alone():
+    budget = MemoryBudget(100)
+    assert budget.try_acquire(500)
+    assert not budget.try_acquire(1)
+    budget.release(500)
+    assert budget.try_acquire(1)
+
+def test_acquire_waits_for_release():
+    budget = MemoryBudget(100)
+    budget.try_acquire(80)
+    assert not budget.acquire(50, timeout=0.01)
+    threading.Timer(0.05, budget.release, (80,)).start()
+    started = time.monotonic()
+    assert budget.acquire(50, timeout=5)
+    assert time.monotonic() - started < 1
+    assert budget.peak == 80
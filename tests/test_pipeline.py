@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Конвейер чтение -> обработка -> запись (StampPipeline.run_pipeline, stamp_batch)"""
+
+import os
+import random
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import StampPipeline
+from DateStamp import StampJob, stamp_batch
+
+def test_results_keep_input_order():
+    delays = [random.Random(seed).uniform(0, 0.01) for seed in range(40)]
+
+    def process(item, data):
+        time.sleep(delays[item])
+        return data * 2
+
+    results = list(StampPipeline.run_pipeline(range(40), lambda item: item, process,
+                                              lambda item, data: data + 1, workers=4))
+    assert [item for item, _, _ in results] == list(range(40))
+    assert [result for _, result, _ in results] == [item * 2 + 1 for item in range(40)]
+
+def test_stage_errors_are_returned_per_item():
+    def read(item):
+        if item == 1:
+            raise OSError('read')
+        return item
+
+    def process(item, data):
+        if item == 2:
+            raise ValueError('process')
+        return data
+
+    def write(item, data):
+        if item == 3:
+            raise RuntimeError('write')
+        return data
+
+    results = list(StampPipeline.run_pipeline(range(5), read, process, write, workers=2))
+    errors = [type(error).__name__ if error else None for _, _, error in results]
+    assert errors == [None, 'OSError', 'ValueError', 'RuntimeError', None]
+    assert results[4][1] == 4
+
+def test_source_error_is_raised_after_items():
+    def items():
+        yield 0
+        raise KeyError('source')
+
+    results = StampPipeline.run_pipeline(items(), lambda item: item, lambda item, data: data,
+                                         lambda item, data: data)
+    assert next(results)[0] == 0
+    with pytest.raises(KeyError):
+        next(results)
+
+def test_close_stops_reading():
+    read_count = []
+
+    def items():
+        for item in range(10000):
+            yield item
+
+    def read(item):
+        read_count.append(item)
+        return item
+
+    threads_before = threading.active_count()
+    results = StampPipeline.run_pipeline(items(), read, lambda item, data: data,
+                                         lambda item, data: data, workers=2, queue_size=2)
+    for item, _, _ in results:
+        if item == 5:
+            break
+    results.close()
+    # Прочитано не больше, чем помещается в очереди конвейера
+    assert len(read_count) < 50
+    assert threading.active_count() == threads_before
+
+def test_stamp_batch_writes_in_order(tmp_path):
+    jobs = []
+    for index in range(8):
+        source = str(tmp_path / f'IMG_20200101_1010{index:02d}.jpg')
+        Image.new('RGB', (160, 90), 'gray').save(source)
+        jobs.append(StampJob(source, str(tmp_path / f'out_{index}.jpg'), None))
+    jobs.append(StampJob(str(tmp_path / 'missing.jpg'), str(tmp_path / 'out_missing.jpg'), None))
+
+    results = list(stamp_batch(jobs, font_size=12, workers=3))
+    assert [result.job for result in results] == jobs
+    assert all(result.success for result in results[:-1])
+    assert results[-1].error is not None
+    for job in jobs[:-1]:
+        with Image.open(job.dest_path) as image:
+            assert image.size == (160, 90)
+    assert not os.path.exists(jobs[-1].dest_path)
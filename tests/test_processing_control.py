@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Пауза и отмена обработки (StampPipeline.ProcessingControl)"""
+
+import threading
+import time
+
+from StampPipeline import ProcessingControl
+
+def test_not_paused_returns_immediately():
+    assert ProcessingControl().wait_while_paused(timeout=0) is True
+
+def test_pause_times_out():
+    control = ProcessingControl()
+    control.pause()
+    assert control.wait_while_paused(timeout=0.01) is False
+    assert control.paused and not control.cancelled
+
+def test_resume_wakes_waiter():
+    control = ProcessingControl()
+    control.pause()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(control.wait_while_paused(timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    control.resume()
+    waiter.join(timeout=5)
+    assert results == [True]
+
+def test_cancel_wakes_paused_waiter():
+    control = ProcessingControl()
+    control.pause()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(control.wait_while_paused(timeout=5)))
+    waiter.start()
+    started = time.monotonic()
+    control.cancel()
+    waiter.join(timeout=5)
+    assert results == [False]
+    assert time.monotonic() - started < 1
+    assert control.cancelled
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Обход папок с изображениями (ImageScanner)"""
+
+import os
+import threading
+
+import pytest
+
+import ImageScanner
+
+@pytest.fixture
+def tree(tmp_path):
+    """Дерево: изображения на трех уровнях, посторонние файлы, папка вывода"""
+    for folder in ('', 'a', 'a/b', 'c', 'out'):
+        os.makedirs(tmp_path / folder, exist_ok=True)
+        for name in ('one.jpg', 'two.PNG', 'notes.txt'):
+            (tmp_path / folder / name).write_bytes(b'x')
+    return tmp_path
+
+def relative(files):
+    return sorted(os.path.join(scanned.rel_dir, scanned.name) for scanned in files)
+
+def test_sequential_scan(tree):
+    files = relative(ImageScanner.scan_images(str(tree), exclude=(str(tree / 'out'),)))
+    assert len(files) == 8
+    assert os.path.join('a', 'b', 'one.jpg') in files
+    assert not any(name.endswith('.txt') or name.startswith('out') for name in files)
+
+def test_parallel_scan_matches_sequential(tree):
+    exclude = (str(tree / 'out'),)
+    sequential = relative(ImageScanner.scan_images(str(tree), exclude=exclude, with_stat=True))
+    parallel = list(ImageScanner.scan_images_parallel(str(tree), exclude=exclude, with_stat=True, threads=4))
+    assert relative(parallel) == sequential
+    assert all(scanned.stat is not None for scanned in parallel)
+
+def test_parallel_scan_close_stops_threads(tree):
+    threads_before = threading.active_count()
+    files = ImageScanner.scan_images_parallel(str(tree), threads=4)
+    next(files)
+    files.close()
+    assert threading.active_count() == threads_before
+
+def test_missing_root_reports_error(tmp_path):
+    errors = []
+    missing = str(tmp_path / 'missing')
+    assert list(ImageScanner.iter_images(missing, onerror=errors.append, threads=2)) == []
+    assert len(errors) == 1